@@ -0,0 +1,406 @@
+"""
+Benchmark do pipeline de geração do transforms_fake.
+
+Gera um dataset sintético com a resolução, a quantidade de fontes e de
+instâncias pedidas, mede cada estágio isoladamente (leitura/redimensionamento,
+extração, preenchimento do fundo, rotação, composição, codificação e gravação),
+compara a composição serial com a composição em lote e roda
+``process_images`` de ponta a ponta nos modos serial, em lote e paralelo. O
+resultado é um JSON com amostras/s, percentis de latência por estágio e pico
+de memória (RSS somado de todos os processos e de cada worker), para comparar
+versões e modos.
+
+Uso:
+    python benchmarks/bench_pipeline.py --resolution 1428x1068 --sources 8 \\
+        --variations 20 --instances 2 --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transforms_fake import core  # noqa: E402
+from transforms_fake.mask_index import build_mask_index, match_mask  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+STAGES = ('load', 'extract', 'background', 'rotate', 'composite', 'encode', 'write')
+
+MODES = {
+    'serial': {'workers': 1, 'batch_size': 1},
+    'batched': {'workers': 1, 'batch_size': 8},
+    'parallel': {'workers': None, 'batch_size': 1},
+}
+
+def make_dataset(root, sources, resolution, instances, seed=0):
+    """Cria ``sources`` pares imagem/máscara com ``instances`` objetos cada."""
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    image_dir = os.path.join(root, 'images')
+    mask_dir = os.path.join(root, 'masks')
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(mask_dir, exist_ok=True)
+
+    radius = max(4, min(width, height) // (6 * max(1, instances)))
+    for i in range(sources):
+        # Fundo com textura suave, para a codificação PNG ter custo realista
+        noise = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+        img = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+        mask = np.zeros((height, width), dtype=np.uint8)
+        for _ in range(instances):
+            cx = int(rng.integers(2 * radius, width - 2 * radius))
+            cy = int(rng.integers(2 * radius, height - 2 * radius))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            # Corpo (1), cabeça (2) e cauda (3), como no exemplo dos ratos
+            shape = np.zeros_like(mask)
+            cv2.ellipse(shape, (cx, cy), (radius, radius // 2), 0, 0, 360, 1, -1)
+            cv2.circle(shape, (cx + radius, cy), radius // 3, 2, -1)
+            cv2.line(shape, (cx - radius, cy), (cx - 2 * radius, cy), 3, max(1, radius // 8))
+            # Só a instância atual recebe a cor, sem repintar as anteriores
+            inside = shape > 0
+            mask[inside] = shape[inside]
+            img[inside] = color
+        name = f'frame_{i:05d}'
+        cv2.imwrite(os.path.join(image_dir, f'{name}.jpg'), img)
+        cv2.imwrite(os.path.join(mask_dir, f'{name}.png'), mask)
+    return image_dir, mask_dir
+
+def summarize(samples):
+    """Percentis de latência (ms) de uma lista de durações em segundos."""
+    if not samples:
+        return {'count': 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        'count': len(samples),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p90_ms': float(np.percentile(ms, 90)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+def process_tree_rss(pid=None):
+    """
+    RSS em bytes de cada processo da árvore de ``pid`` (ele e todos os
+    descendentes), como ``{pid: bytes}``. Usa o psutil se estiver instalado
+    e, sem ele, o ``/proc`` do Linux; devolve None se nenhum existir.
+    """
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return {}
+        rss = {}
+        for proc in procs:
+            try:
+                rss[proc.pid] = proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+    if not os.path.isdir('/proc'):
+        return None
+    page = os.sysconf('SC_PAGE_SIZE')
+    rss, stack = {}, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                rss[current] = int(f.read().split()[1]) * page
+            for thread in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{thread}/children') as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            # Processo encerrado durante a leitura
+            continue
+    return rss
+
+class RssSampler:
+    """
+    Amostra periodicamente o RSS da árvore de processos atual numa thread.
+
+    ``ru_maxrss`` dos filhos é o pico de um único filho, não a soma dos
+    workers; aqui o pico da soma de todos os processos é medido diretamente,
+    junto com o pico de cada processo.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_total = 0
+        self.peaks = {}
+        self.available = process_tree_rss() is not None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss = process_tree_rss() or {}
+        self.peak_total = max(self.peak_total, sum(rss.values()))
+        for pid, value in rss.items():
+            self.peaks[pid] = max(self.peaks.get(pid, 0), value)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if self.available:
+            self._sample()
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.available:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+
+    def report(self):
+        """Picos em MB: soma da árvore, processo principal e cada worker."""
+        if not self.available:
+            return {'peak_rss_mb': None}
+        mb = 1024 * 1024
+        main = os.getpid()
+        return {
+            'peak_rss_mb': self.peak_total / mb,
+            'peak_rss_main_mb': self.peaks.get(main, 0) / mb,
+            'peak_rss_workers_mb': [value / mb for pid, value in sorted(self.peaks.items()) if pid != main],
+        }
+
+def bench_stages(image_dir, mask_dir, variations, seed, instances, out_dir):
+    """Mede cada estágio do pipeline separadamente, no processo atual."""
+    timings = {stage: [] for stage in STAGES}
+    mask_index = build_mask_index(mask_dir, use_cache=False)
+    files = core._list_image_files(image_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    ignore = lambda text: None  # noqa: E731
+
+    for img_index, img_file in enumerate(files):
+        task = core._Task(image_dir, mask_dir, None, img_file, img_index, len(files), core.TARGET_SIZE,
+                          seed, 0, variations, mask_file=match_mask(mask_index, img_file),
+                          instances=instances)
+
+        t = time.perf_counter()
+        sources = core._load_sources(task, ignore)
+        timings['load'].append(time.perf_counter() - t)
+        if sources is None:
+            continue
+        img, mask = sources
+
+        t = time.perf_counter()
+        extracted = core._extract_objects(task, img, mask, ignore)
+        timings['extract'].append(time.perf_counter() - t)
+        if extracted is None:
+            continue
+        objects, fill_rects, object_mask_inv = extracted
+
+        t = time.perf_counter()
+        filled = core._fill_background(task, img, mask, fill_rects, object_mask_inv, ignore)
+        timings['background'].append(time.perf_counter() - t)
+        if filled is None:
+            continue
+        fundo_sem_objeto, _ = filled
+
+        for i in range(variations):
+            rng = core._task_rng(seed, img_file, i)
+            instance = core._pick_object(objects, rng)
+            object_cropped, object_mask_original_cropped = objects[instance]
+
+            t = time.perf_counter()
+            params = core.DEFAULT_TRANSFORM.sample(rng)
+            _, object_rotated, mask_rotated = core._warp_object(
+                object_cropped, object_mask_original_cropped, params)
+            timings['rotate'].append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            img_variacao = fundo_sem_objeto.copy()
+            mask_variacao = np.zeros(fundo_sem_objeto.shape[:2], dtype=np.uint8)
+            h_r, w_r = object_rotated.shape[:2]
+            x_new, y_new = core._choose_position(w_r, h_r, core.TARGET_SIZE, rng)
+            core._paste(img_variacao, mask_variacao, object_rotated, mask_rotated, x_new, y_new)
+            timings['composite'].append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            _, img_png = cv2.imencode('.png', img_variacao)
+            _, mask_png = cv2.imencode('.png', mask_variacao)
+            timings['encode'].append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            with open(os.path.join(out_dir, 'img.png'), 'wb') as f:
+                f.write(img_png.tobytes())
+            with open(os.path.join(out_dir, 'mask.png'), 'wb') as f:
+                f.write(mask_png.tobytes())
+            timings['write'].append(time.perf_counter() - t)
+
+    return {stage: summarize(samples) for stage, samples in timings.items()}
+
+def bench_compose(image_dir, mask_dir, variations, seed, instances, batch_sizes, repeats=3):
+    """
+    Compara a composição serial (``_compose_variation``, uma cópia do fundo
+    por amostra) com a composição em lote (``_compose_batch`` em buffers
+    pré-alocados) no fundo da primeira fonte, sem codificação nem gravação.
+    Devolve amostras/s de cada modo (melhor de ``repeats`` rodadas).
+    """
+    mask_index = build_mask_index(mask_dir, use_cache=False)
+    img_file = core._list_image_files(image_dir)[0]
+    task = core._Task(image_dir, mask_dir, None, img_file, 0, 1, core.TARGET_SIZE, seed, 0, variations,
+                      mask_file=match_mask(mask_index, img_file), instances=instances)
+    prepared = core._prepare_background(task, lambda text: None)
+    if prepared is None:
+        return {}
+    _, _, objects, fundo_sem_objeto, _ = prepared
+    rngs = lambda: [core._task_rng(seed, img_file, i) for i in range(variations)]  # noqa: E731
+
+    def best_rate(run):
+        best = min(_timed(run) for _ in range(repeats))
+        return variations / best if best > 0 else None
+
+    def serial():
+        for rng in rngs():
+            core._compose_variation(fundo_sem_objeto, objects, rng)
+
+    results = {'serial': {'samples_per_sec': best_rate(serial)}}
+    for batch_size in batch_sizes:
+        out_images = np.empty((batch_size,) + fundo_sem_objeto.shape, dtype=np.uint8)
+        out_masks = np.empty((batch_size,) + fundo_sem_objeto.shape[:2], dtype=np.uint8)
+
+        def batched():
+            all_rngs = rngs()
+            for start in range(0, variations, batch_size):
+                core._compose_batch(fundo_sem_objeto, objects, all_rngs[start:start + batch_size],
+                                    out_images, out_masks)
+
+        rate = best_rate(batched)
+        results[f'batch_{batch_size}'] = {
+            'samples_per_sec': rate,
+            'speedup': rate / results['serial']['samples_per_sec'] if rate else None,
+        }
+    return results
+
+def _timed(run):
+    t = time.perf_counter()
+    run()
+    return time.perf_counter() - t
+
+def run_mode(image_dir, mask_dir, out_dir, sources, variations, seed, instances, workers, batch_size):
+    """Roda ``process_images`` de ponta a ponta e devolve as métricas."""
+    shutil.rmtree(out_dir, ignore_errors=True)
+    with RssSampler() as rss:
+        t = time.perf_counter()
+        core.process_images(image_dir, mask_dir, out_dir, sources, variations, seed=seed,
+                            workers=workers, batch_size=batch_size, instances=instances)
+        elapsed = time.perf_counter() - t
+    samples = len(os.listdir(os.path.join(out_dir, 'novos_objetos')))
+    metrics = {
+        'workers': workers or os.cpu_count(),
+        'batch_size': batch_size,
+        'samples': samples,
+        'seconds': elapsed,
+        'samples_per_sec': samples / elapsed if elapsed > 0 else None,
+    }
+    metrics.update(rss.report())
+    return metrics
+
+def run_mode_isolated(args, mode, image_dir, mask_dir, out_dir):
+    """Roda um modo num processo separado, para que o pico de RSS seja só dele."""
+    params = MODES[mode]
+    workers = args.workers if params['workers'] is None else params['workers']
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-mode', mode,
+           '--image-dir', image_dir, '--mask-dir', mask_dir, '--out-dir', out_dir,
+           '--sources', str(args.sources), '--variations', str(args.variations),
+           '--seed', str(args.seed), '--instances', str(args.instances),
+           '--workers', str(workers or 0), '--batch-size', str(params['batch_size'])]
+    result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(result.stdout)
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolution', type=parse_resolution, default=(1428, 1068),
+                        help='Resolução das fontes sintéticas, LARGURAxALTURA')
+    parser.add_argument('--sources', type=int, default=4, help='Número de pares imagem/máscara')
+    parser.add_argument('--variations', type=int, default=20, help='Variações por fundo')
+    parser.add_argument('--instances', type=int, default=1, help='Objetos por imagem (>1 ativa instances=True)')
+    parser.add_argument('--modes', default='serial,batched,parallel',
+                        help=f'Modos de ponta a ponta, entre {", ".join(MODES)}')
+    parser.add_argument('--workers', type=int, default=None, help='Workers do modo paralelo (padrão: todos os núcleos)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-stages', action='store_true', help='Não mede os estágios isolados')
+    parser.add_argument('--compose-batch-sizes', default='4,16',
+                        help='Tamanhos de lote comparados com a composição serial (vazio não compara)')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--workdir', help='Pasta de trabalho (padrão: temporária, apagada no fim)')
+    # Usados internamente por run_mode_isolated
+    parser.add_argument('--run-mode', help=argparse.SUPPRESS)
+    parser.add_argument('--image-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--mask-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--out-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--batch-size', type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_mode:
+        metrics = run_mode(args.image_dir, args.mask_dir, args.out_dir, args.sources, args.variations,
+                           args.seed, args.instances > 1, args.workers or None, args.batch_size)
+        print(json.dumps(metrics))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='transforms_fake_bench_')
+    try:
+        image_dir, mask_dir = make_dataset(os.path.join(workdir, 'dataset'), args.sources,
+                                           args.resolution, args.instances, args.seed)
+        report = {
+            'config': {
+                'resolution': list(args.resolution),
+                'target_size': list(core.TARGET_SIZE),
+                'sources': args.sources,
+                'variations': args.variations,
+                'instances': args.instances,
+                'seed': args.seed,
+                'cpu_count': os.cpu_count(),
+                'opencv': cv2.__version__,
+                'numpy': np.__version__,
+                'python': sys.version.split()[0],
+            },
+            'end_to_end': {},
+        }
+        if not args.skip_stages:
+            random.seed(args.seed)
+            report['stages'] = bench_stages(image_dir, mask_dir, args.variations, args.seed,
+                                            args.instances > 1, os.path.join(workdir, 'stages'))
+        batch_sizes = [int(size) for size in args.compose_batch_sizes.split(',') if size]
+        if batch_sizes:
+            report['compose'] = bench_compose(image_dir, mask_dir, args.variations, args.seed,
+                                              args.instances > 1, batch_sizes)
+        for mode in filter(None, args.modes.split(',')):
+            report['end_to_end'][mode] = run_mode_isolated(args, mode, image_dir, mask_dir,
+                                                           os.path.join(workdir, f'out_{mode}'))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
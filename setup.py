@@ -6,9 +6,12 @@ setup(
     packages=find_packages(),  # Isso busca a pasta transforms_fake com __init__.py
     install_requires=[
          "opencv-python>=4.5.0",
-        "numpy>=1.19.0",
-        "PyQt5>=5.15.0"
+        "numpy>=1.19.0"
     ],
+    extras_require={
+        'gui': ["PyQt5>=5.15.0"],
+        'yaml': ["PyYAML>=5.1"],
+    },
     entry_points={
         'console_scripts': [
             'transforms-fake=transforms_fake.__main__:main'
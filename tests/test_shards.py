@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+from transforms_fake.core import process_images
+from transforms_fake.shards import ShardWriter
+
+def _make_dataset(root, count=4):
+    image_dir = os.path.join(root, 'images')
+    mask_dir = os.path.join(root, 'masks')
+    os.makedirs(image_dir)
+    os.makedirs(mask_dir)
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        img = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+        mask = np.zeros((240, 320), np.uint8)
+        cv2.circle(mask, (80 + 10 * i, 80), 25, 1, -1)
+        cv2.rectangle(mask, (200, 150 + 5 * i), (230, 190), 2, -1)
+        cv2.imwrite(os.path.join(image_dir, f'frame_{i:05d}.png'), img)
+        cv2.imwrite(os.path.join(mask_dir, f'frame_{i:05d}.png'), mask)
+    return image_dir, mask_dir
+
+def _outputs(path):
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            if name != 'manifest.json':
+                with open(os.path.join(root, name), 'rb') as f:
+                    files[name] = hashlib.sha1(f.read()).hexdigest()
+    return files
+
+@pytest.mark.parametrize('use_bank', [False, True])
+def test_parts_union_matches_single_run(tmp_path, use_bank):
+    image_dir, mask_dir = _make_dataset(str(tmp_path))
+    kwargs = dict(seed=3, target_size=(320, 240), instances=True, min_instance_area=16)
+
+    single = tmp_path / 'single'
+    bank = str(tmp_path / 'bank-single') if use_bank else None
+    process_images(image_dir, mask_dir, str(single), 4, 6, object_bank=bank, **kwargs)
+    expected = _outputs(single)
+
+    union = {}
+    for part in range(3):
+        out = tmp_path / f'part-{part}'
+        bank = str(tmp_path / f'bank-{part}') if use_bank else None
+        process_images(image_dir, mask_dir, str(out), 4, 6, object_bank=bank,
+                       part_index=part, num_parts=3, **kwargs)
+        files = _outputs(out)
+        # As partes não geram a mesma amostra duas vezes
+        assert not set(files) & set(union)
+        union.update(files)
+
+    assert len(expected) == 4 * 2 + 4 * 6 * 2
+    assert union == expected
+
+def _run_part(image_dir, mask_dir, out, bank, part, kwargs):
+    process_images(image_dir, mask_dir, out, 8, 4, object_bank=bank, part_index=part, num_parts=3, **kwargs)
+    return _outputs(out)
+
+def test_parts_share_object_bank_concurrently(tmp_path):
+    image_dir, mask_dir = _make_dataset(str(tmp_path), count=8)
+    kwargs = dict(seed=3, target_size=(320, 240), instances=True, min_instance_area=16)
+    process_images(image_dir, mask_dir, str(tmp_path / 'single'), 8, 4, **kwargs)
+    expected = _outputs(tmp_path / 'single')
+
+    # As partes de um job reaproveitam a mesma configuração, e portanto o mesmo banco
+    bank = str(tmp_path / 'bank')
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(_run_part, image_dir, mask_dir, str(tmp_path / f'part-{part}'), bank, part, kwargs)
+                   for part in range(3)]
+        union = {}
+        for future in futures:
+            union.update(future.result())
+
+    assert union == expected
+
+def _tar_members(path):
+    names = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.tar'):
+            with tarfile.open(os.path.join(path, name)) as tar:
+                names += tar.getnames()
+    return names
+
+def _sample(key, data=b'x'):
+    return [(f'{key}.png', data), (f'{key}.mask.png', data)]
+
+def test_shard_writer_drops_superseded_and_stale_shards(tmp_path):
+    path = str(tmp_path / 'shards')
+    with ShardWriter(path, samples_per_shard=2) as writer:
+        for i in range(5):
+            writer.add(_sample(f's{i}'))
+
+    # Retomada que regrava duas amostras: as cópias antigas saem dos shards antigos
+    with ShardWriter(path, samples_per_shard=2, append=True) as writer:
+        writer.add(_sample('s1', b'new') + _sample('s4', b'new'))
+    names = _tar_members(path)
+    assert sorted(names) == sorted(name for i in range(5) for name, _ in _sample(f's{i}'))
+    with open(os.path.join(path, 'index.json'), encoding='utf-8') as f:
+        index = json.load(f)
+    assert [shard['file'] for shard in index['shards']] == [f'shard-{i:06d}.tar' for i in range(3)]
+    entry = index['samples']['s1']
+    offset, size = entry['members']['png']
+    with open(os.path.join(path, index['shards'][entry['shard']]['file']), 'rb') as f:
+        f.seek(offset)
+        assert f.read(size) == b'new'
+
+    # Execução nova com menos amostras: nenhum shard antigo fica na pasta
+    with ShardWriter(path, samples_per_shard=2) as writer:
+        writer.add(_sample('s0'))
+    assert sorted(os.listdir(path)) == ['index.json', 'shard-000000.tar']
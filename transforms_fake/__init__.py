@@ -1 +1,12 @@
-from .main import MainWindow
+from .core import iter_synthetic_samples, process_images
+from .instrumentation import Tracer
+from .rotate_image_and_mask import rotate_image_and_mask
+from .transforms import ObjectTransform
+
+def __getattr__(name):
+    # A interface gráfica é carregada sob demanda para não importar PyQt5
+    # em usos sem tela (servidores, workers, scripts).
+    if name == 'MainWindow':
+        from .main import MainWindow
+        return MainWindow
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,136 @@
+"""
+Linha de comando do transforms_fake.
+
+    transforms-fake generate --config job.yaml [--workers 8] [--seed 42]
+                             [--sink shards] [--shard-index 3 --num-shards 16]
+    transforms-fake gui
+
+O arquivo de configuração (YAML ou JSON) traz os argumentos de
+``process_images`` com os mesmos nomes; as opções da linha de comando
+sobrescrevem os valores do arquivo. Com ``--num-shards``, cada nó de um
+cluster gera uma parte determinística do dataset em
+``{output_dir}/part-{índice}``, sem nenhuma coordenação entre os nós.
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+
+from .core import process_images
+from .instrumentation import Tracer
+
+# Argumentos de process_images que não fazem sentido num arquivo de configuração
+_RUNTIME_ARGS = ('log_widget', 'progress', 'tracer', 'part_index', 'num_parts', 'output_layout')
+_REQUIRED_KEYS = ('image_dir', 'mask_dir', 'output_dir')
+
+def _config_keys():
+    params = inspect.signature(process_images).parameters
+    return [name for name in params if name not in _RUNTIME_ARGS]
+
+def load_config(path):
+    """
+    Lê um arquivo de configuração de job (``.yaml``/``.yml`` ou ``.json``).
+
+    Raises:
+        ValueError: Se o arquivo não for um mapeamento ou tiver chaves que
+            ``process_images`` não aceita
+    """
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError('Configurações YAML precisam do PyYAML: pip install transforms_fake[yaml]')
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f'{path}: a configuração deve ser um mapeamento de argumentos')
+    unknown = sorted(set(config) - set(_config_keys()))
+    if unknown:
+        raise ValueError(f'{path}: argumentos desconhecidos: {", ".join(unknown)}')
+    if config.get('target_size') is not None:
+        config['target_size'] = tuple(config['target_size'])
+    return config
+
+def _generate(args):
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f'❌ {e}', file=sys.stderr)
+        return 2
+    overrides = {
+        'workers': args.workers, 'seed': args.seed, 'sink': args.sink, 'output_dir': args.output,
+        'num_fundos': args.num_fundos, 'num_ratos_por_fundo': args.variations,
+    }
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    if args.resume:
+        config['resume'] = True
+    missing = [key for key in _REQUIRED_KEYS if key not in config]
+    if missing:
+        print(f'❌ Faltam argumentos na configuração: {", ".join(missing)}', file=sys.stderr)
+        return 2
+    # Sem limite: None processa todos os fundos da pasta
+    config.setdefault('num_fundos', None)
+    config.setdefault('num_ratos_por_fundo', 1)
+
+    if args.num_shards > 1:
+        config['output_dir'] = os.path.join(config['output_dir'], f'part-{args.shard_index:05d}')
+
+    failed = []
+
+    def progress(text):
+        print(text, flush=True)
+        if text.startswith('❌'):
+            failed.append(text)
+
+    tracer = Tracer() if args.stats else None
+    # --shard-index/--num-shards escolhem a parte do dataset, não os tars de sink='shards'
+    process_images(progress=progress, tracer=tracer, part_index=args.shard_index,
+                   num_parts=args.num_shards, **config)
+    if tracer is not None:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            f.write(tracer.to_json())
+    return 1 if failed else 0
+
+def _gui(args):
+    from .main import main as gui_main
+    gui_main()
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='transforms-fake',
+                                     description='Gerador de dados sintéticos por cópia e cola de objetos.')
+    commands = parser.add_subparsers(dest='command')
+
+    generate = commands.add_parser('generate', help='Gera um dataset a partir de um arquivo de configuração')
+    generate.add_argument('--config', required=True, help='Arquivo YAML ou JSON com os argumentos do job')
+    generate.add_argument('--output', help='Pasta de saída (sobrescreve output_dir)')
+    generate.add_argument('--num-fundos', type=int, help='Número de fundos (padrão: todos)')
+    generate.add_argument('--variations', type=int, help='Variações por fundo (num_ratos_por_fundo)')
+    generate.add_argument('--workers', type=int, help='Processos de geração (0 usa todos os núcleos)')
+    generate.add_argument('--seed', type=int, help='Semente base (obrigatória com --num-shards)')
+    generate.add_argument('--sink', choices=('dirs', 'shards'), help='Saída em pastas ou em shards tar')
+    generate.add_argument('--resume', action='store_true', help='Retoma uma execução interrompida')
+    generate.add_argument('--shard-index', type=int, default=0, help='Parte gerada por este nó (a partir de 0)')
+    generate.add_argument('--num-shards', type=int, default=1, help='Número de partes do dataset')
+    generate.add_argument('--stats', help='Grava os tempos e contadores da execução neste JSON')
+    generate.set_defaults(handler=_generate)
+
+    gui = commands.add_parser('gui', help='Abre a interface gráfica (requer PyQt5)')
+    gui.set_defaults(handler=_gui)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.command == 'generate' and not 0 <= args.shard_index < args.num_shards:
+        parser.error('--shard-index deve estar entre 0 e --num-shards - 1')
+    return args.handler(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
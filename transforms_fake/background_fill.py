@@ -0,0 +1,159 @@
+"""
+Reconstrução do fundo sob os objetos removidos.
+
+O modo original ('patch') cobre o retângulo de cada objeto com um pedaço de
+fundo limpo do mesmo tamanho e descarta o quadro quando não existe nenhum;
+em quadros cheios isso acontece com frequência. Os modos daqui preenchem
+apenas os pixels dos objetos (a máscara dilatada) e sempre produzem um
+fundo:
+
+- 'telea' e 'ns': ``cv2.inpaint`` recortado à região de cada buraco, então o
+  custo depende do tamanho dos objetos e não do quadro;
+- 'pyramid': preenchimento multiescala (pull-push) numa pirâmide gaussiana,
+  em tempo linear, indicado para buracos grandes em que o inpainting fica
+  lento e borrado;
+- 'median': fundo limpo (clean plate) estimado pela mediana temporal de
+  vários quadros de uma câmera fixa, como em ``example/rats``; os pixels
+  nunca vistos sem objeto caem no modo 'pyramid'.
+"""
+import cv2
+import numpy as np
+
+FILL_MODES = ('patch', 'telea', 'ns', 'pyramid', 'median')
+
+# Pixels acrescentados em volta dos objetos (bordas suavizadas e sombras)
+DILATE_PIXELS = 3
+# Raio de vizinhança do cv2.inpaint
+INPAINT_RADIUS = 3
+# Linhas processadas de cada vez no cálculo da mediana temporal
+_MEDIAN_ROWS = 64
+
+def hole_mask(object_mask):
+    """Máscara booleana dos pixels a preencher: os objetos dilatados."""
+    k = 2 * DILATE_PIXELS + 1
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+    return cv2.dilate((object_mask > 0).astype(np.uint8), kernel) > 0
+
+def hole_regions(hole, margin):
+    """
+    Retângulos ``(x, y, w, h)`` de cada componente conexo de ``hole``,
+    ampliados em ``margin`` pixels (mais contexto) e limitados ao quadro.
+    """
+    num, _, stats, _ = cv2.connectedComponentsWithStats(hole.astype(np.uint8), connectivity=8)
+    height, width = hole.shape
+    regions = []
+    for x, y, w, h, _ in stats[1:num]:
+        x0, y0 = max(int(x) - margin, 0), max(int(y) - margin, 0)
+        x1, y1 = min(int(x + w) + margin, width), min(int(y + h) + margin, height)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+    return regions
+
+def inpaint_fill(image, hole, method='telea'):
+    """
+    Preenche ``hole`` em ``image`` (in-place) com ``cv2.inpaint``, região por
+    região, só no recorte em volta de cada buraco.
+    """
+    flags = cv2.INPAINT_TELEA if method == 'telea' else cv2.INPAINT_NS
+    for x, y, w, h in hole_regions(hole, 2 * INPAINT_RADIUS):
+        roi_hole = hole[y:y+h, x:x+w]
+        roi = image[y:y+h, x:x+w]
+        filled = cv2.inpaint(roi, roi_hole.astype(np.uint8) * 255, INPAINT_RADIUS, flags)
+        np.copyto(roi, filled, where=roi_hole[..., None])
+    return image
+
+def _pull_push(image, hole):
+    """
+    Interpola os pixels de ``hole`` a partir dos conhecidos numa pirâmide:
+    desce acumulando cor e peso até não restar buraco e sobe completando
+    cada nível com o nível abaixo.
+    """
+    known = (~hole).astype(np.float32)
+    color = image.astype(np.float32) * known[..., None]
+    levels = [(color, known)]
+    while known.min() <= 0 and min(known.shape) > 1:
+        color, known = cv2.pyrDown(color), cv2.pyrDown(known)
+        levels.append((color, known))
+    color, known = levels.pop()
+    filled = color / np.maximum(known, 1e-8)[..., None]
+    for color, known in reversed(levels):
+        up = cv2.pyrUp(filled, dstsize=(known.shape[1], known.shape[0]))
+        # ``color`` já vem multiplicado pelo peso: completa com o nível de baixo
+        filled = color + up * (1 - np.minimum(known, 1))[..., None]
+    return filled
+
+def pyramid_fill(image, hole):
+    """
+    Preenche ``hole`` em ``image`` (in-place) por interpolação multiescala,
+    região por região, com uma margem de contexto proporcional ao buraco.
+    """
+    for x, y, w, h in hole_regions(hole, 0):
+        margin = max(16, max(w, h) // 2)
+        x0, y0 = max(x - margin, 0), max(y - margin, 0)
+        x1, y1 = min(x + w + margin, image.shape[1]), min(y + h + margin, image.shape[0])
+        roi_hole = hole[y0:y1, x0:x1]
+        roi = image[y0:y1, x0:x1]
+        if roi_hole.all():
+            continue
+        filled = _pull_push(roi, roi_hole)
+        np.copyto(roi, np.clip(filled + 0.5, 0, 255).astype(np.uint8), where=roi_hole[..., None])
+    return image
+
+def masked_median(frames, backgrounds):
+    """
+    Mediana temporal de cada pixel considerando só os quadros em que ele é
+    fundo.
+
+    Args:
+        frames: Array ``(N, H, W, 3)`` uint8 com quadros de uma câmera fixa
+        backgrounds: Array ``(N, H, W)`` bool, True onde o pixel é fundo
+
+    Returns:
+        Array ``(H, W, 4)`` uint8: a imagem mediana (BGR) e, no quarto canal,
+        255 onde o pixel foi visto como fundo em algum quadro e 0 onde não.
+    """
+    n, height, width = backgrounds.shape
+    plate = np.zeros((height, width, 4), dtype=np.uint8)
+    for y in range(0, height, _MEDIAN_ROWS):
+        strip = frames[:, y:y+_MEDIAN_ROWS].astype(np.uint16)
+        seen = backgrounds[:, y:y+_MEDIAN_ROWS]
+        # Pixels de objeto vão para o fim da ordenação; a mediana usa só os vistos
+        strip[~seen] = np.iinfo(np.uint16).max
+        strip.sort(axis=0)
+        count = seen.sum(axis=0)
+        lo = np.maximum(count - 1, 0) // 2
+        hi = count // 2
+        low = np.take_along_axis(strip, lo[None, ..., None].repeat(3, axis=-1), axis=0)[0]
+        high = np.take_along_axis(strip, hi[None, ..., None].repeat(3, axis=-1), axis=0)[0]
+        median = (low + high + 1) // 2
+        valid = count > 0
+        plate[y:y+_MEDIAN_ROWS, :, :3] = np.where(valid[..., None], median, 0)
+        plate[y:y+_MEDIAN_ROWS, :, 3] = valid * 255
+    return plate
+
+def plate_fill(image, hole, plate):
+    """
+    Copia para ``hole`` os pixels do fundo limpo ``plate`` (veja
+    ``masked_median``); o que o fundo limpo não cobre é preenchido com
+    ``pyramid_fill``.
+    """
+    covered = plate[..., 3] > 0
+    np.copyto(image, plate[..., :3], where=(hole & covered)[..., None])
+    rest = hole & ~covered
+    if rest.any():
+        pyramid_fill(image, rest)
+    return image
+
+def fill_holes(image, object_mask, mode, plate=None):
+    """
+    Devolve uma cópia de ``image`` com os objetos de ``object_mask``
+    removidos pelo modo ``mode`` ('telea', 'ns', 'pyramid' ou 'median').
+    """
+    hole = hole_mask(object_mask)
+    filled = image.copy()
+    if not hole.any():
+        return filled
+    if mode in ('telea', 'ns'):
+        return inpaint_fill(filled, hole, mode)
+    if mode == 'median' and plate is not None:
+        return plate_fill(filled, hole, plate)
+    return pyramid_fill(filled, hole)
@@ -0,0 +1,1807 @@
+"""
+Núcleo de geração de dados sintéticos, sem dependência de Qt.
+
+Importar este módulo carrega apenas OpenCV e NumPy, então ele pode ser usado
+em servidores e workers sem interface gráfica. A interface PyQt5 em
+``transforms_fake.main`` é apenas um frontend sobre estas funções.
+"""
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+from collections import deque, namedtuple
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+import cv2
+import numpy as np
+
+from .background_fill import FILL_MODES, fill_holes, hole_mask, masked_median, pyramid_fill
+from .free_space import FreeSpaceIndex
+from .instrumentation import NULL_TRACER, Tracer, profiled, worker_profiled
+from .manifest import RunManifest, file_stamp
+from .mask_index import build_mask_index, match_mask
+from .object_bank import ObjectBank
+from .rotation_bank import RotationBank
+from .shards import ShardWriter, key_stem, sample_key
+from .transforms import (DEFAULT_TRANSFORM, ObjectTransform, adjust_colors, feather_blend, poisson_blend,
+                         warp_object, warped_size)
+from .video import RunningMedian, VideoFrames, frame_name, is_video
+from .writer import IMAGE_FORMATS, AsyncImageWriter, encode_params
+
+# Tamanho (largura, altura) para o qual todas as imagens são redimensionadas
+TARGET_SIZE = (1428, 1068)
+
+# Nomes da saída em pastas: subpastas e prefixos dos arquivos do fundo sem
+# objeto (a imagem e a máscara toda zero). As variações mantêm o nome da fonte.
+OutputLayout = namedtuple('OutputLayout', [
+    'background_dir', 'objects_dir', 'masks_dir', 'metadata_dir', 'background_prefix', 'background_mask_prefix',
+])
+DEFAULT_LAYOUT = OutputLayout('fundos_sem_objeto', 'novos_objetos', 'mascaras', 'metadados',
+                              'fundo_sem_objeto_', 'fundo_sem_objeto_mask_')
+
+# Estimativas de memória por pixel usadas com ``memory_budget_mb``: o fundo
+# preparado (imagem, máscara, fundo reconstruído, imagem integral e
+# temporários da extração) e cada amostra em memória (imagem, máscara e
+# bytes codificados).
+_BACKGROUND_BYTES_PER_PIXEL = 16
+_FRAME_BYTES_PER_PIXEL = 8
+# Bytes codificados (imagem e máscara) por pixel de uma amostra, no pior caso
+_ENCODED_BYTES_PER_PIXEL = 4
+# Bytes de amostras codificadas que uma tarefa do pool devolve de uma vez na
+# saída em shards
+_SHARD_TASK_BYTES = 64 * 1024 * 1024
+
+# Quadros amostrados (espaçados igualmente) para o fundo mediano de uma câmera fixa
+_PLATE_FRAMES = 16
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def _task_rng(seed, *keys):
+    """Cria um gerador aleatório determinístico para uma tarefa.
+
+    A semente depende apenas da semente base e das chaves da tarefa (nome do
+    fundo, índice da variação), então o resultado não muda com o número de
+    workers nem com a ordem de execução.
+    """
+    return random.Random(':'.join(str(k) for k in (seed,) + keys))
+
+def _list_image_files(image_dir):
+    return sorted([f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS)])
+
+# Tarefa de geração: um intervalo [start, stop) de variações de um fundo.
+_Task = namedtuple('_Task', [
+    'image_dir', 'mask_dir', 'output_dirs', 'img_file', 'img_index', 'num_fundos',
+    'target_size', 'seed', 'start', 'stop', 'batch_size', 'rotation_step', 'rotation_cache_mb',
+    'writer', 'mask_file', 'avoid_overlap', 'instances', 'min_instance_area', 'object_bank',
+    'trace', 'profile', 'roi_only', 'memory_budget', 'transform', 'objects_per_image', 'max_overlap', 'pool',
+    'background_fill', 'plate', 'layout',
+], defaults=(1, None, 256, None, None, False, False, 64, None, None, None, False, None, DEFAULT_TRANSFORM,
+             1, 0.0, None, 'patch', None, DEFAULT_LAYOUT))
+
+# Formato de saída e estágio de gravação assíncrona. Com ``shards``, as
+# imagens codificadas voltam ao processo principal em vez de irem para disco.
+_WriterConfig = namedtuple('_WriterConfig', [
+    'image_format', 'image_quality', 'mask_compression', 'threads', 'max_pending', 'shards',
+], defaults=('png', None, None, 2, 16, False))
+
+# Fundo preparado: imagem e máscara redimensionadas, objetos recortados (lista
+# de pares imagem/máscara com as classes originais), fundo reconstruído e
+# índice de regiões livres da máscara original.
+_Background = namedtuple('_Background', [
+    'img', 'mask', 'objects', 'fundo_sem_objeto', 'free_space',
+])
+
+# Distância (em pixels) até a qual partes separadas são agrupadas na mesma instância
+_INSTANCE_GAP = 5
+
+def _find_instances(object_mask, min_area):
+    """
+    Separa a máscara binária em instâncias com ``connectedComponentsWithStats``.
+
+    Partes a até ``_INSTANCE_GAP`` pixels umas das outras (por exemplo, a
+    cauda de um animal) ficam na mesma instância.
+
+    Returns:
+        Tupla (labels, rects, keep): mapa de rótulos, bbox ``(x, y, w, h)``
+        de cada instância e os rótulos com área mínima para serem colados.
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (_INSTANCE_GAP, _INSTANCE_GAP))
+    grouped = cv2.dilate(object_mask, kernel)
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(grouped, connectivity=8)
+    labels[object_mask == 0] = 0
+
+    rects, keep = {}, []
+    for label in range(1, num_labels):
+        # Os pixels da instância estão dentro da bbox do componente dilatado:
+        # a comparação se restringe a ela, em vez do quadro inteiro
+        x, y, w, h = stats[label, :4]
+        coords = cv2.findNonZero((labels[y:y+h, x:x+w] == label).astype(np.uint8))
+        if coords is None:
+            continue
+        rx, ry, rw, rh = cv2.boundingRect(coords)
+        rects[label] = (int(x) + rx, int(y) + ry, rw, rh)
+        if len(coords) >= min_area:
+            keep.append(label)
+    return labels, rects, keep
+
+def _load_sources(task, log):
+    """
+    Lê a imagem e a máscara de um fundo e as redimensiona para ``target_size``
+    (com ``target_size`` None, a imagem mantém a resolução nativa e só a
+    máscara é ajustada a ela, se necessário).
+
+    Returns:
+        Tupla (img, mask) ou None se o fundo deve ser pulado.
+    """
+    img_file = task.img_file
+    mask_file = task.mask_file
+    if mask_file is None:
+        log(f'⚠️ Nenhuma máscara encontrada para {img_file}, pulando...')
+        return None
+
+    img_path = os.path.join(task.image_dir, img_file)
+    mask_path = os.path.join(task.mask_dir, mask_file)
+
+    img = cv2.imread(img_path)
+    mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+
+    if img is None or mask is None:
+        log(f'⚠️ Erro ao abrir imagem ou máscara para {img_file}')
+        return None
+
+    return _fit_sources(img, mask, task.target_size)
+
+def _fit_sources(img, mask, target_size):
+    """Redimensiona a imagem e a máscara para ``target_size`` (ou a máscara para a imagem)."""
+    if target_size is not None:
+        img = cv2.resize(img, target_size)
+        mask = cv2.resize(mask, target_size, interpolation=cv2.INTER_NEAREST)
+    elif mask.shape != img.shape[:2]:
+        mask = cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
+    return img, mask
+
+def _extract_objects(task, img, mask, log):
+    """
+    Recorta os objetos (um único recorte ou um por instância).
+
+    Returns:
+        Tupla (objects, fill_rects, object_mask_inv): pares imagem/máscara
+        recortados, retângulos a preencher no fundo e a máscara inversa dos
+        objetos; ou None se o fundo deve ser pulado.
+    """
+    img_file = task.img_file
+
+    # Mascara binária para objeto (qualquer classe 1,2,3 vira 255)
+    object_mask = np.isin(mask, [1, 2, 3]).astype(np.uint8) * 255
+    object_mask_inv = cv2.bitwise_not(object_mask)
+
+    coords = cv2.findNonZero(object_mask)
+    if coords is None:
+        log(f'⚠️ Nenhum objeto encontrado na máscara de {img_file}, pulando...')
+        return None
+
+    if task.instances:
+        labels, rects, keep = _find_instances(object_mask, task.min_instance_area)
+        log(f'Processando {img_file} ({task.img_index+1}/{task.num_fundos}), {len(keep)} instâncias')
+        objects = []
+        for label in keep:
+            x, y, w, h = rects[label]
+            # Recorte justo de cada instância, sem pixels das vizinhas
+            instance_mask = np.where(labels[y:y+h, x:x+w] == label, mask[y:y+h, x:x+w], 0).astype(np.uint8)
+            objects.append((img[y:y+h, x:x+w], instance_mask))
+        fill_rects = [rects[label] for label in sorted(rects)]
+        if not objects:
+            log(f'⚠️ Nenhuma instância com área mínima em {img_file}, pulando...')
+            return None
+    else:
+        x, y, w, h = cv2.boundingRect(coords)
+        log(f'Processando {img_file} ({task.img_index+1}/{task.num_fundos}), objeto bbox: x={x}, y={y}, w={w}, h={h}')
+
+        object_cropped = img[y:y+h, x:x+w]
+        object_mask_original_cropped = mask[y:y+h, x:x+w]  # máscara original com classes 1,2,3
+        objects = [(object_cropped, object_mask_original_cropped)]
+        fill_rects = [(x, y, w, h)]
+
+    return objects, fill_rects, object_mask_inv
+
+def _fill_background(task, img, mask, fill_rects, object_mask_inv, log, tracer=NULL_TRACER):
+    """
+    Remove os objetos e reconstrói o fundo: no modo 'patch', cobre cada
+    retângulo com um pedaço de fundo limpo; nos demais, preenche os pixels
+    dos objetos (veja ``background_fill``) e nunca pula o fundo.
+
+    Returns:
+        Tupla (fundo_sem_objeto, free_space) ou None se o fundo deve ser pulado.
+    """
+    if task.background_fill != 'patch':
+        plate = _load_plate(task.plate, img.shape) if task.background_fill == 'median' else None
+        fundo_sem_objeto = fill_holes(img, cv2.bitwise_not(object_mask_inv), task.background_fill, plate)
+        tracer.count('holes_filled')
+        return fundo_sem_objeto, FreeSpaceIndex(mask)
+
+    # Cria fundo sem objeto
+    fundo_sem_objeto = cv2.bitwise_and(img, img, mask=object_mask_inv)
+
+    # Encontra um patch do fundo para substituir a área de cada objeto no fundo_sem_objeto
+    free_space = FreeSpaceIndex(mask)
+    rng = _task_rng(task.seed, task.img_file, 'fundo')
+    for x, y, w, h in fill_rects:
+        patch_pos = free_space.sample(w, h, rng, exclude_rect=(x, y, w, h))
+        tracer.count('patch_searches')
+        if patch_pos is None:
+            tracer.count('patch_search_failures')
+            log(f'⚠️ Não encontrou região de fundo adequada para preencher o objeto em {task.img_file}, pulando...')
+            return None
+
+        patch_x, patch_y = patch_pos
+        fundo_patch = img[patch_y:patch_y+h, patch_x:patch_x+w]
+        fundo_sem_objeto[y:y+h, x:x+w] = fundo_patch
+
+    return fundo_sem_objeto, free_space
+
+def _prepare_background(task, log, tracer=NULL_TRACER):
+    """
+    Carrega a imagem e a máscara, extrai o objeto e reconstrói o fundo.
+
+    Returns:
+        Um ``_Background`` ou None se o fundo deve ser pulado.
+    """
+    with tracer.stage('load', source=task.img_file):
+        sources = _load_sources(task, log)
+    if sources is None:
+        tracer.count('images_skipped')
+        return None
+    img, mask = sources
+
+    with tracer.stage('extract', source=task.img_file):
+        extracted = _extract_objects(task, img, mask, log)
+    if extracted is None:
+        tracer.count('images_skipped')
+        return None
+    objects, fill_rects, object_mask_inv = extracted
+
+    with tracer.stage('background', source=task.img_file):
+        filled = _fill_background(task, img, mask, fill_rects, object_mask_inv, log, tracer)
+    if filled is None:
+        tracer.count('images_skipped')
+        return None
+    fundo_sem_objeto, free_space = filled
+
+    tracer.count('backgrounds_prepared')
+    tracer.count('objects_extracted', len(objects))
+    return _Background(img, mask, objects, fundo_sem_objeto, free_space)
+
+def _sample_transform(transform, rng, w, h, target_size):
+    """Sorteia a transformação de um objeto ``w × h``, reduzindo a escala se ele não couber no quadro."""
+    params = transform.sample(rng)
+    out_w, out_h = warped_size(w, h, params.scale)
+    if out_w > target_size[0] or out_h > target_size[1]:
+        params = params._replace(scale=params.scale * min(target_size[0] / out_w, target_size[1] / out_h))
+    return params
+
+def _warp_object(object_cropped, object_mask_original_cropped, params, rotation_bank=None, bank_key=None,
+                 out=None):
+    """
+    Aplica a parte geométrica da transformação, consultando o banco de
+    rotações se houver um. O banco guarda só rotações puras: com escala ou
+    espelhamento o ângulo também é arredondado, mas o objeto é transformado
+    diretamente.
+
+    Returns:
+        Tupla (parâmetros efetivamente usados, imagem transformada, máscara transformada).
+    """
+    if rotation_bank is not None:
+        params = params._replace(angle=rotation_bank.quantize(params.angle))
+        if params.scale == 1.0 and not params.hflip and not params.vflip:
+            return (params,) + tuple(rotation_bank.rotate(
+                bank_key, object_cropped, object_mask_original_cropped, params.angle, out=out))
+    return (params,) + tuple(warp_object(object_cropped, object_mask_original_cropped, params, out=out))
+
+def _choose_position(w, h, target_size, rng, placement=None):
+    """
+    Sorteia o canto superior esquerdo onde colar um objeto ``w × h``.
+
+    Com ``placement`` (um ``FreeSpaceIndex``), só são aceitas posições sem
+    primeiro plano; se nenhuma couber, o sorteio volta a ser livre.
+    """
+    if placement is not None:
+        position = placement.sample(w, h, rng)
+        if position is not None:
+            return position
+    return rng.randint(0, target_size[0] - w), rng.randint(0, target_size[1] - h)
+
+def _paste(img_variacao, mask_variacao, object_rotated, mask_rotated, x_new, y_new, blend='paste', feather=5):
+    """
+    Cola o objeto rotacionado (e sua máscara de classes) em ``(x_new, y_new)``,
+    com o modo de mesclagem ``blend`` ('paste', 'feather' ou 'poisson').
+    """
+    h_r, w_r = object_rotated.shape[:2]
+    roi = img_variacao[y_new:y_new+h_r, x_new:x_new+w_r]
+    if blend == 'feather':
+        feather_blend(roi, object_rotated, mask_rotated, feather)
+    elif blend != 'poisson' or not poisson_blend(roi, object_rotated, mask_rotated):
+        # Colagem direta (também usada quando o objeto é pequeno demais para o Poisson)
+        # Máscara binária para usar no bitwise_and (apenas 255/0)
+        mask_rotated_bin = (mask_rotated > 0).astype(np.uint8) * 255
+        roi_bg = cv2.bitwise_and(roi, roi, mask=cv2.bitwise_not(mask_rotated_bin))
+        object_fg = cv2.bitwise_and(object_rotated, object_rotated, mask=mask_rotated_bin)
+        dst = cv2.add(roi_bg, object_fg)
+        img_variacao[y_new:y_new+h_r, x_new:x_new+w_r] = dst
+
+    # Coloca a máscara rotacionada com as classes originais (1,2,3)
+    # Usando máscara rotacionada com classes originais, que pode conter valores 1,2,3 em vez de 255.
+    # Só os pixels do objeto são copiados, para não apagar objetos colados antes.
+    np.copyto(mask_variacao[y_new:y_new+h_r, x_new:x_new+w_r], mask_rotated, where=mask_rotated > 0)
+
+def _pick_object(objects, rng):
+    """Sorteia qual objeto colar (sem consumir o gerador se houver só um)."""
+    return rng.randrange(len(objects)) if len(objects) > 1 else 0
+
+def _compose_variation(fundo_sem_objeto, objects, rng, rotation_bank=None, bank_key=None, placement=None,
+                       tracer=NULL_TRACER, transform=DEFAULT_TRANSFORM):
+    """
+    Gera uma variação: sorteia um dos objetos, aplica o pipeline de
+    transformações e o cola numa posição aleatória de uma cópia do fundo.
+
+    Returns:
+        Tupla (img_variacao, mask_variacao, info), onde info descreve a
+        transformação aplicada (objeto, ângulo e posição).
+    """
+    with tracer.stage('copy'):
+        img_variacao = fundo_sem_objeto.copy()
+        mask_variacao = np.zeros(fundo_sem_objeto.shape[:2], dtype=np.uint8)
+    info = _compose_into(img_variacao, mask_variacao, objects, rng, rotation_bank, bank_key, placement, tracer,
+                         transform)
+    return img_variacao, mask_variacao, info
+
+def _compose_into(canvas, canvas_mask, objects, rng, rotation_bank=None, bank_key=None, placement=None,
+                  tracer=NULL_TRACER, transform=DEFAULT_TRANSFORM):
+    """
+    Cola uma variação diretamente em ``canvas`` (que contém o fundo) e
+    ``canvas_mask`` (zerada), alterando só a região do objeto colado.
+
+    Returns:
+        Dict com a transformação aplicada; ``x``, ``y``, ``w`` e ``h``
+        delimitam a região alterada.
+    """
+    target_size = (canvas.shape[1], canvas.shape[0])
+    instance = _pick_object(objects, rng)
+    object_cropped, object_mask_original_cropped = objects[instance]
+
+    # Sorteia rotação, escala, espelhamento e cores conforme o pipeline
+    h, w = object_cropped.shape[:2]
+    params = _sample_transform(transform, rng, w, h, target_size)
+    with tracer.stage('rotate'):
+        params, object_rotated, mask_rotated = _warp_object(
+            object_cropped, object_mask_original_cropped, params, rotation_bank, (bank_key, instance))
+        object_rotated = adjust_colors(object_rotated, params)
+
+    h_r, w_r = object_rotated.shape[:2]
+
+    with tracer.stage('composite'):
+        # Escolhe uma posição aleatória onde o objeto rotacionado caiba na imagem
+        x_new, y_new = _choose_position(w_r, h_r, target_size, rng, placement)
+
+        _paste(canvas, canvas_mask, object_rotated, mask_rotated, x_new, y_new, transform.blend, transform.feather)
+    tracer.count('samples')
+
+    return _sample_info(instance, params, x_new, y_new, w_r, h_r)
+
+def _compose_batch(fundo_sem_objeto, objects, rngs, out_images, out_masks, rotation_bank=None, bank_key=None,
+                   placement=None, tracer=NULL_TRACER, transform=DEFAULT_TRANSFORM):
+    """
+    Gera várias variações de uma vez em buffers pré-alocados.
+
+    Equivale a chamar ``_compose_variation`` para cada gerador em ``rngs``,
+    mas sem alocar imagens novas: os objetos rotacionados vão para uma pilha
+    ``(N, h, w)`` (do tamanho do maior objeto) e cada um é colado com uma
+    cópia condicional restrita ao seu retângulo, em vez da cadeia
+    bitwise_and/bitwise_not/add por amostra. Com mesclagem 'feather' ou
+    'poisson', cada objeto é mesclado separadamente.
+
+    Args:
+        rngs: Um gerador aleatório por variação do lote
+        out_images: Buffer ``(N, H, W, 3)`` que recebe as imagens
+        out_masks: Buffer ``(N, H, W)`` que recebe as máscaras
+
+    Returns:
+        Lista com o dict de informações de cada variação.
+    """
+    n = len(rngs)
+    target_size = (fundo_sem_objeto.shape[1], fundo_sem_objeto.shape[0])
+    xs = np.empty(n, dtype=np.intp)
+    ys = np.empty(n, dtype=np.intp)
+
+    # Mesma sequência de sorteios de _compose_variation; o tamanho de cada
+    # objeto transformado só depende da escala, então a pilha é alocada antes
+    # de transformar
+    draws = []
+    for k, rng in enumerate(rngs):
+        instance = _pick_object(objects, rng)
+        h, w = objects[instance][0].shape[:2]
+        params = _sample_transform(transform, rng, w, h, target_size)
+        w_r, h_r = warped_size(w, h, params.scale)
+        xs[k], ys[k] = _choose_position(w_r, h_r, target_size, rng, placement)
+        draws.append((instance, params, w_r, h_r))
+
+    max_h = max(h_r for _, _, _, h_r in draws)
+    max_w = max(w_r for _, _, w_r, _ in draws)
+    rotated = np.empty((n, max_h, max_w, 3), dtype=np.uint8)
+    masks = np.zeros((n, max_h, max_w), dtype=np.uint8)
+
+    infos = []
+    for k, (instance, params, w_r, h_r) in enumerate(draws):
+        object_cropped, object_mask_original_cropped = objects[instance]
+        with tracer.stage('rotate'):
+            params, _, _ = _warp_object(object_cropped, object_mask_original_cropped, params,
+                                        rotation_bank, (bank_key, instance),
+                                        out=(rotated[k, :h_r, :w_r], masks[k, :h_r, :w_r]))
+            adjust_colors(rotated[k, :h_r, :w_r], params, out=rotated[k, :h_r, :w_r])
+        infos.append(_sample_info(instance, params, int(xs[k]), int(ys[k]), w_r, h_r))
+
+    with tracer.stage('composite', batch=n):
+        out_images[:n] = fundo_sem_objeto
+        out_masks[:n] = 0
+
+        for k, (_, _, w_r, h_r) in enumerate(draws):
+            x, y = xs[k], ys[k]
+            if transform.blend == 'paste':
+                # Cópia condicional só no retângulo do objeto, direto no buffer
+                # (cv2.copyTo escreve na própria fatia, sem índices nem temporários)
+                mask_k = masks[k, :h_r, :w_r]
+                cv2.copyTo(rotated[k, :h_r, :w_r], mask_k, out_images[k, y:y+h_r, x:x+w_r])
+                cv2.copyTo(mask_k, mask_k, out_masks[k, y:y+h_r, x:x+w_r])
+            else:
+                _paste(out_images[k], out_masks[k], rotated[k, :h_r, :w_r], masks[k, :h_r, :w_r],
+                       x, y, transform.blend, transform.feather)
+    tracer.count('samples', n)
+
+    return infos
+
+# Tentativas de posicionar cada objeto de uma cena antes de descartá-lo
+_PLACEMENT_ATTEMPTS = 20
+
+def _compose_scene(canvas, canvas_mask, pool, count, rng, rotation_bank=None, placement=None,
+                   tracer=NULL_TRACER, transform=DEFAULT_TRANSFORM, max_overlap=0.0):
+    """
+    Cola ``count`` objetos sorteados de ``pool`` em ``canvas`` e
+    ``canvas_mask``, alterando só as regiões coladas.
+
+    Cada posição sorteada é testada contra os objetos já colados: primeiro
+    pelas caixas (só as que se cruzam são examinadas) e depois pixel a pixel
+    nas interseções, então o custo de cada tentativa depende dos vizinhos e
+    não do tamanho do quadro. Um objeto sem posição válida após
+    ``_PLACEMENT_ATTEMPTS`` tentativas é descartado. A máscara recebe as
+    classes de cada objeto por cima das anteriores.
+
+    Returns:
+        Dict com ``objects``: os objetos colados na ordem de oclusão (``z``
+        crescente; cada um cobre os anteriores), com fonte, transformação e
+        região.
+    """
+    target_size = (canvas.shape[1], canvas.shape[0])
+    placed = []
+    objects = []
+    for _ in range(count):
+        choice = rng.randrange(len(pool)) if len(pool) > 1 else 0
+        image, mask, source, instance, rotation_key = pool[choice]
+        h, w = image.shape[:2]
+        params = _sample_transform(transform, rng, w, h, target_size)
+        with tracer.stage('rotate'):
+            params, warped, warped_mask = _warp_object(image, mask, params, rotation_bank, rotation_key)
+            warped = adjust_colors(warped, params)
+        h_r, w_r = warped.shape[:2]
+        inside = warped_mask > 0
+        area = max(int(np.count_nonzero(inside)), 1)
+
+        with tracer.stage('composite'):
+            position = None
+            for _ in range(_PLACEMENT_ATTEMPTS):
+                tracer.count('placement_attempts')
+                x, y = _choose_position(w_r, h_r, target_size, rng, placement)
+                if _overlap(x, y, inside, placed) <= max_overlap * area:
+                    position = (x, y)
+                    break
+            if position is None:
+                tracer.count('placements_rejected')
+                continue
+            x, y = position
+            _paste(canvas, canvas_mask, warped, warped_mask, x, y, transform.blend, transform.feather)
+
+        placed.append((x, y, inside))
+        info = _sample_info(instance, params, x, y, w_r, h_r)
+        info.update(source=source, z=len(objects))
+        objects.append(info)
+    tracer.count('samples')
+    return {'objects': objects}
+
+def _overlap(x, y, inside, placed):
+    """Pixels de ``inside`` colado em ``(x, y)`` que cobrem objetos já colados."""
+    h, w = inside.shape
+    total = 0
+    for px, py, p_inside in placed:
+        ph, pw = p_inside.shape
+        x0, y0 = max(x, px), max(y, py)
+        x1, y1 = min(x + w, px + pw), min(y + h, py + ph)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        total += np.count_nonzero(inside[y0-y:y1-y, x0-x:x1-x] & p_inside[y0-py:y1-py, x0-px:x1-px])
+    return total
+
+def _sample_info(instance, params, x, y, w, h):
+    """Descrição de uma variação: objeto, transformação sorteada e região colada."""
+    return {'instance': instance, 'angle': params.angle, 'scale': params.scale, 'hflip': params.hflip,
+            'vflip': params.vflip, 'contrast': params.alpha, 'brightness': params.beta,
+            'x': x, 'y': y, 'w': w, 'h': h}
+
+def _bank_key(task):
+    """Chave de um fundo no banco de objetos: fonte e parâmetros de extração."""
+    size = 'nativo' if task.target_size is None else '{}x{}'.format(*task.target_size)
+    name = task.img_file
+    if is_video(task.image_dir):
+        name = f'{os.path.basename(task.image_dir)}:{name}'
+    key = f'{name}|{size}|{int(task.instances)}|{task.min_instance_area}'
+    if task.background_fill != 'patch':
+        # O fundo mediano depende de todas as fontes; a pasta dele identifica quais
+        fill = task.background_fill
+        if task.plate is not None:
+            fill += '-' + os.path.basename(task.plate)
+        key += f'|{fill}'
+    return key
+
+def _source_stamp(task):
+    """Assinatura das fontes de um fundo (nome da máscara, mtime e tamanho)."""
+    stamp = [task.mask_file]
+    paths = [os.path.join(task.image_dir, task.img_file)]
+    if task.mask_file is not None:
+        paths.append(os.path.join(task.mask_dir, task.mask_file))
+    for path in paths:
+        st = os.stat(path)
+        stamp += [st.st_mtime_ns, st.st_size]
+    return stamp
+
+def _trace_mode(tracer):
+    """Define o que os workers devolvem: só estatísticas ou também os eventos para os hooks."""
+    if tracer is NULL_TRACER:
+        return None
+    return 'events' if tracer.hooks else 'stats'
+
+def _task_tracer(task):
+    """Tracer local de uma tarefa, devolvido ao processo principal via ``to_dict``."""
+    if task.trace is None:
+        return NULL_TRACER
+    return Tracer(record_events=task.trace == 'events')
+
+def _extract_background(task):
+    """Extrai um fundo para o banco de objetos (executado nos workers)."""
+    messages = []
+    tracer = _task_tracer(task)
+    with worker_profiled(task.profile):
+        prepared = _prepare_background(task, messages.append, tracer)
+    if prepared is not None:
+        # A imagem completa e o índice de regiões livres não vão para o banco
+        prepared = prepared._replace(img=None, free_space=None)
+    return task, prepared, messages, tracer.to_dict() if task.trace else None
+
+def _fill_object_bank(bank, tasks, pool, log, tracer=NULL_TRACER):
+    """
+    Garante que os fundos das tarefas estão no banco de objetos, extraindo
+    (no pool, se houver) apenas os que faltam ou cujas fontes mudaram.
+
+    Returns:
+        As tarefas cujos fundos têm objetos utilizáveis.
+    """
+    usable = set()
+    missing = []
+    checked = set()
+    for task in tasks:
+        # Um fundo pode ter várias tarefas, e nenhuma começando na variação 0
+        # (retomada, divisão em partes): o banco é consultado uma vez por fundo
+        if task.img_file in checked:
+            continue
+        checked.add(task.img_file)
+        stamp = _source_stamp(task)
+        entry = bank.get(_bank_key(task), stamp)
+        if entry is None:
+            missing.append((task, stamp))
+        elif 'arrays' in entry:
+            usable.add(task.img_file)
+            tracer.count('bank_hits')
+            log(f'♻️ {task.img_file}: objetos lidos do banco')
+        else:
+            tracer.count('images_skipped')
+            for text in entry['messages']:
+                log(text)
+
+    if missing:
+        log(f'🗃️ Extraindo {len(missing)} fundos para o banco de objetos...')
+        stamps = {task.img_file: stamp for task, stamp in missing}
+        extract = pool.map if pool is not None else map
+        for task, prepared, messages, stats in extract(_extract_background, [task for task, _ in missing]):
+            if stats is not None:
+                tracer.merge(stats)
+            for text in messages:
+                log(text)
+            if prepared is None:
+                # Guarda só o motivo do descarte para não tentar de novo
+                bank.put(_bank_key(task), stamps[task.img_file], messages[-1:])
+            else:
+                bank.put(_bank_key(task), stamps[task.img_file], messages,
+                         prepared.mask, prepared.fundo_sem_objeto, prepared.objects)
+                usable.add(task.img_file)
+        bank.save()
+
+    return [task for task in tasks if task.img_file in usable]
+
+# Banco de objetos aberto neste processo, reaberto quando o índice muda.
+_object_bank = {}
+
+def _open_object_bank(path):
+    """Banco de objetos deste processo, reaberto quando o índice muda."""
+    index_mtime = os.stat(os.path.join(path, 'index.json')).st_mtime_ns
+    key = (path, index_mtime)
+    if key not in _object_bank:
+        _object_bank.clear()
+        _object_bank[key] = ObjectBank(path)
+    return _object_bank[key]
+
+def _load_from_bank(task):
+    """
+    Monta o fundo preparado a partir de views do banco de objetos. Máscaras
+    guardadas em PNG (quadros de vídeo) só são decodificadas com
+    ``avoid_overlap``; sem ela, o fundo preparado fica sem máscara e sem
+    índice de regiões livres.
+    """
+    entry = _open_object_bank(task.object_bank).load(_bank_key(task), mask=task.avoid_overlap)
+    if entry['objects'] is None:
+        return None
+    fundo_sem_objeto = entry['fundo_sem_objeto']
+    if fundo_sem_objeto is None:
+        # Quadro de vídeo: o fundo é o do clipe inteiro
+        fundo_sem_objeto = _clip_background(task.plate, entry['shape'])
+    mask = entry['mask']
+    free_space = FreeSpaceIndex(mask) if mask is not None else None
+    return _Background(None, mask, entry['objects'], fundo_sem_objeto, free_space)
+
+# Objetos de todas as fontes (views do banco), usados com ``mix_sources``.
+_object_pool = {}
+
+def _load_pool(task):
+    """
+    Lista de objetos de todas as fontes do sorteio: tuplas (imagem, máscara,
+    fonte, instância, chave no banco de rotações).
+    """
+    bank = _open_object_bank(task.object_bank)
+    key = (id(bank), task.pool)
+    if key not in _object_pool:
+        pool = []
+        for bank_key in task.pool:
+            source = bank_key.split('|', 1)[0]
+            for instance, (image, mask) in enumerate(bank.load(bank_key, mask=False)['objects']):
+                pool.append((image, mask, source, instance, ('pool', bank_key, instance)))
+        _object_pool.clear()
+        _object_pool[key] = pool
+    return _object_pool[key]
+
+# Banco de rotações deste processo, compartilhado entre as tarefas que ele executa.
+_rotation_bank = None
+
+def _get_rotation_bank(step, cache_mb):
+    global _rotation_bank
+    if step is None:
+        return None
+    max_bytes = cache_mb * 1024 * 1024
+    if _rotation_bank is None or _rotation_bank.step != step or _rotation_bank.max_bytes != max_bytes:
+        _rotation_bank = RotationBank(step, max_bytes)
+    return _rotation_bank
+
+# Último fundo preparado neste processo (e seus logs), reaproveitado entre blocos do mesmo fundo.
+_background_cache = {}
+
+# Fundos medianos abertos neste processo, por pasta e tamanho.
+_plate_cache = {}
+
+def _clear_caches():
+    """
+    Esvazia os caches de módulo deste processo (fundos, fundos medianos,
+    banco de objetos e sorteio), liberando os arquivos mapeados em memória.
+    Chamado ao fim de cada execução: os caches valem para uma execução só e
+    podem apontar para uma pasta temporária já apagada.
+    """
+    global _rotation_bank
+    _background_cache.clear()
+    _plate_cache.clear()
+    _object_pool.clear()
+    _object_bank.clear()
+    _rotation_bank = None
+
+def _plate_id(tasks):
+    """Identificador do fundo mediano das fontes de ``tasks`` (nomes, mtime e tamanho)."""
+    stamps = [[task.img_file, list(task.target_size) if task.target_size else None] + _source_stamp(task)
+              for task in tasks]
+    return hashlib.sha1(json.dumps(stamps).encode('utf-8')).hexdigest()[:16]
+
+def _plate_path(path, shape):
+    return os.path.join(path, f'{shape[1]}x{shape[0]}.npy')
+
+def _build_plates(tasks, path, log, tracer=NULL_TRACER):
+    """
+    Calcula em ``path`` o fundo mediano (veja ``masked_median``) de cada
+    tamanho de quadro, a partir de até ``_PLATE_FRAMES`` fontes igualmente
+    espaçadas. Fundos já calculados na pasta são reaproveitados.
+    """
+    os.makedirs(path, exist_ok=True)
+    tasks = [task for task in tasks if task.mask_file is not None]
+    if tasks and tasks[0].target_size is not None:
+        width, height = tasks[0].target_size
+        if os.path.exists(_plate_path(path, (height, width))):
+            return
+    step = max(1, len(tasks) // _PLATE_FRAMES)
+    groups = {}
+    with tracer.stage('background', source='mediana'):
+        for task in tasks[::step][:_PLATE_FRAMES]:
+            sources = _load_sources(task, log)
+            if sources is None:
+                continue
+            img, mask = sources
+            frames, backgrounds = groups.setdefault(img.shape, ([], []))
+            frames.append(img)
+            backgrounds.append(~hole_mask(np.isin(mask, [1, 2, 3])))
+        for shape, (frames, backgrounds) in groups.items():
+            plate_path = _plate_path(path, shape)
+            if os.path.exists(plate_path):
+                continue
+            plate = masked_median(np.stack(frames), np.stack(backgrounds))
+            tmp_path = f'{plate_path}.{os.getpid()}.tmp.npy'
+            np.save(tmp_path, plate)
+            os.replace(tmp_path, plate_path)
+            log(f'🎞️ Fundo mediano {shape[1]}x{shape[0]} calculado com {len(frames)} quadros')
+
+def _clip_background(path, shape):
+    """Fundo limpo de um clipe de vídeo (imagem BGR contígua), carregado uma vez por processo."""
+    key = (path, shape[:2], 'bgr')
+    if key not in _plate_cache:
+        _plate_cache[key] = np.ascontiguousarray(_load_plate(path, shape)[..., :3])
+    return _plate_cache[key]
+
+def _ingest_video(template, stride, max_frames, log, tracer=NULL_TRACER):
+    """
+    Lê os quadros do vídeo ``template.image_dir`` numa thread de
+    decodificação e guarda os objetos de cada quadro no banco
+    ``template.object_bank``, sem gravar quadros em disco. As máscaras vêm
+    de uma pasta (``frame_00001.png``, ...) ou de um vídeo de máscaras com os
+    mesmos quadros (só codecs sem perdas preservam as classes).
+
+    O fundo limpo do clipe é estimado uma única vez por uma mediana
+    temporal dos pixels sem objeto de todos os quadros lidos; pixels nunca
+    vistos sem objeto são preenchidos por interpolação. Ele é gravado em
+    ``plates/`` no banco e usado como fundo de todos os quadros.
+
+    Returns:
+        Tupla (quadros, máscaras, pasta do fundo): nomes dos quadros com
+        objetos utilizáveis, dict nome → arquivo de máscara e o valor de
+        ``_Task.plate`` para esses quadros.
+    """
+    video_path, mask_dir = template.image_dir, template.mask_dir
+    frames = VideoFrames(video_path, stride, max_frames)
+    mask_video = is_video(mask_dir)
+    if mask_video:
+        masks = iter(VideoFrames(mask_dir, frames.stride, max_frames, grayscale=True))
+        mask_stamp = file_stamp(mask_dir)
+    else:
+        mask_index = build_mask_index(mask_dir)
+    clip = [os.path.abspath(video_path), file_stamp(video_path), os.path.abspath(mask_dir),
+            frames.stride, max_frames, list(template.target_size) if template.target_size else None]
+    plate = os.path.join(template.object_bank, 'plates',
+                         hashlib.sha1(json.dumps(clip).encode('utf-8')).hexdigest()[:16])
+    bank = ObjectBank(template.object_bank)
+    log(f'🎞️ Lendo {os.path.basename(video_path)}: ~{len(frames)} quadros (passo {frames.stride})')
+
+    names, mask_files = [], {}
+    model = None
+    for index, img in frames:
+        tracer.count('frames_decoded')
+        name = frame_name(index)
+        if mask_video:
+            _, mask = next(masks, (None, None))
+            mask_file = name
+            stamp = clip[1] + mask_stamp + [index]
+        else:
+            mask_file = match_mask(mask_index, name)
+            mask = cv2.imread(os.path.join(mask_dir, mask_file), cv2.IMREAD_GRAYSCALE) if mask_file else None
+            stamp = clip[1] + [index, mask_file] + (file_stamp(os.path.join(mask_dir, mask_file))
+                                                    if mask_file else [])
+        if mask is None:
+            log(f'⚠️ Nenhuma máscara encontrada para {name}, pulando...')
+            tracer.count('images_skipped')
+            continue
+        img, mask = _fit_sources(img, mask, template.target_size)
+        task = template._replace(img_file=name, img_index=len(names), num_fundos=len(frames) or '?',
+                                 mask_file=mask_file, plate=plate)
+        if model is None and not os.path.exists(_plate_path(plate, img.shape)):
+            model = RunningMedian(img.shape)
+        if model is not None:
+            with tracer.stage('background', source=name):
+                model.update(img, ~hole_mask(np.isin(mask, [1, 2, 3])))
+
+        key = _bank_key(task)
+        entry = bank.get(key, stamp)
+        if entry is None:
+            messages = []
+            with tracer.stage('extract', source=name):
+                extracted = _extract_objects(task, img, mask, messages.append)
+            for text in messages:
+                log(text)
+            if extracted is None:
+                bank.put(key, stamp, messages[-1:])
+                tracer.count('images_skipped')
+                continue
+            objects = extracted[0]
+            # Nos quadros, a máscara só serve para avoid_overlap: guardada em PNG
+            bank.put(key, stamp, messages, mask, None, objects, compact_mask=True)
+            tracer.count('objects_extracted', len(objects))
+        elif 'arrays' not in entry:
+            tracer.count('images_skipped')
+            continue
+        else:
+            tracer.count('bank_hits')
+        names.append(name)
+        mask_files[name] = mask_file
+    bank.save()
+
+    if model is not None:
+        with tracer.stage('background', source='clipe'):
+            clean = model.plate()
+            image = np.ascontiguousarray(clean[..., :3])
+            pyramid_fill(image, clean[..., 3] == 0)
+            clean[..., :3] = image
+            os.makedirs(plate, exist_ok=True)
+            plate_path = _plate_path(plate, image.shape)
+            tmp_path = f'{plate_path}.{os.getpid()}.tmp.npy'
+            np.save(tmp_path, clean)
+            os.replace(tmp_path, plate_path)
+        log(f'🎞️ Fundo do clipe estimado com {model.frames} quadros')
+    tracer.count('backgrounds_prepared', len(names))
+    return names, mask_files, plate
+
+def _load_plate(path, shape):
+    """Fundo mediano do tamanho ``shape`` (mapeado em memória), ou None se não houver."""
+    if path is None:
+        return None
+    plate_path = _plate_path(path, shape)
+    if plate_path not in _plate_cache:
+        if not os.path.exists(plate_path):
+            return None
+        _plate_cache[plate_path] = np.load(plate_path, mmap_mode='r')
+    return _plate_cache[plate_path]
+
+def _run_task(task, log, tracer=NULL_TRACER, members=None):
+    """
+    Executa uma tarefa de geração. Só o primeiro bloco de cada fundo emite
+    logs de preparação e salva o fundo sem objeto (nos vídeos, só o do
+    primeiro quadro, com o fundo do clipe).
+
+    Com ``members`` (saída em shards, um ``_SampleMembers``), as imagens
+    codificadas e os metadados de cada amostra são entregues como pares
+    ``(nome, bytes)`` no formato do WebDataset, em vez de gravados nas pastas
+    de saída.
+
+    Returns:
+        True se as variações foram geradas, False se o fundo foi pulado.
+    """
+    output_background_dir, output_objects_dir, output_masks_dir, output_metadata_dir = task.output_dirs
+    img_file = task.img_file
+    first_chunk = task.start == 0
+
+    key = (task.image_dir, task.mask_dir, img_file, task.target_size, task.instances, task.min_instance_area,
+           task.object_bank, task.background_fill, task.plate, task.avoid_overlap, task.seed)
+    if key not in _background_cache:
+        messages = []
+        if task.object_bank is not None:
+            # Os logs da extração já foram emitidos ao preencher o banco
+            with tracer.stage('load', source=img_file):
+                prepared = _load_from_bank(task)
+        else:
+            prepared = _prepare_background(task, messages.append, tracer)
+        _background_cache.clear()
+        _background_cache[key] = (prepared, messages)
+    prepared, messages = _background_cache[key]
+    if first_chunk:
+        for text in messages:
+            log(text)
+    if prepared is None:
+        return False
+
+    img, mask, objects, fundo_sem_objeto, free_space = prepared
+    placement = free_space if task.avoid_overlap else None
+
+    config = task.writer or _WriterConfig()
+    batch_size = min(task.batch_size, max(task.stop - task.start, 1))
+    canvases = 2
+    if task.memory_budget is not None:
+        # Limita as amostras em memória (lotes, telas e fila de gravação) ao orçamento
+        frames = _frames_in_budget(task.memory_budget, fundo_sem_objeto.shape[0] * fundo_sem_objeto.shape[1])
+        if frames < 1:
+            log(f'⚠️ {img_file}: o fundo sozinho excede o orçamento de memória por worker')
+            frames = 1
+        canvases = min(canvases, frames)
+        batch_size = min(batch_size, max(1, frames // 2))
+        config = config._replace(max_pending=min(config.max_pending, 2 * max(1, frames - 1)))
+    image_ext = IMAGE_FORMATS[config.image_format]
+    image_params = encode_params(config.image_format, config.image_quality)
+    mask_params = encode_params('png', config.mask_compression)
+
+    name = _sample_name(img_file, members is not None)
+    sink = (lambda member, data: members.append((member, data))) if members is not None else None
+
+    def output_paths(i):
+        if members is not None:
+            return f'{name}_var{i+1}{image_ext}', f'{name}_var{i+1}.mask.png'
+        return (os.path.join(output_objects_dir, f'{name}_var{i+1}{image_ext}'),
+                os.path.join(output_masks_dir, f'{name}_var{i+1}_mask.png'))
+
+    def add_metadata(i, info):
+        metadata = {'source': img_file, 'variation': i, 'seed': task.seed}
+        metadata.update(info)
+        if members is not None:
+            members.append((f'{name}_var{i+1}.json', json.dumps(metadata).encode('utf-8')))
+        elif pool is not None:
+            # Nas cenas, a ordem de oclusão só existe nos metadados
+            with open(os.path.join(output_metadata_dir, f'{name}_var{i+1}.json'), 'w', encoding='utf-8') as f:
+                json.dump(metadata, f)
+
+    def compose_into(canvas, canvas_mask, rng):
+        # Devolve as informações da amostra e as regiões alteradas no quadro
+        if pool is None:
+            info = _compose_into(canvas, canvas_mask, objects, rng, rotation_bank, bank_key, placement, tracer,
+                                 task.transform)
+            return info, [(info['x'], info['y'], info['w'], info['h'])]
+        info = _compose_scene(canvas, canvas_mask, pool, task.objects_per_image, rng, rotation_bank, placement,
+                              tracer, task.transform, task.max_overlap)
+        return info, [(obj['x'], obj['y'], obj['w'], obj['h']) for obj in info['objects']]
+
+    with AsyncImageWriter(config.threads, config.max_pending, tracer, sink) as writer:
+        background = _background_file(task.image_dir, img_file, task.img_index) if first_chunk else None
+        if background is not None:
+            # Salva a imagem do fundo sem objeto
+            if members is not None:
+                # Nos shards, o fundo usa o formato de saída: a extensão da fonte mudaria a chave
+                background_name = _sample_name(background, shards=True)
+                fundo_sem_objeto_path = f'fundo_sem_objeto_{background_name}{image_ext}'
+                fundo_sem_objeto_mask_path = f'fundo_sem_objeto_{background_name}.mask.png'
+                background_params = image_params
+            else:
+                fundo_sem_objeto_path = os.path.join(output_background_dir,
+                                                     f'{task.layout.background_prefix}{background}')
+                fundo_sem_objeto_mask_path = os.path.join(output_masks_dir,
+                                                          f'{task.layout.background_mask_prefix}{background}')
+                background_params = ()
+            writer.write(fundo_sem_objeto_path, fundo_sem_objeto, background_params)
+            log(f'Fundo sem objeto salvo: {fundo_sem_objeto_path}')
+
+            # SALVA MÁSCARA TODA ZERO PARA O FUNDO SEM OBJETO
+            fundo_sem_objeto_mask = np.zeros(fundo_sem_objeto.shape[:2], dtype=np.uint8)
+            writer.write(fundo_sem_objeto_mask_path, fundo_sem_objeto_mask)
+            log(f'Máscara do fundo sem objeto salva: {fundo_sem_objeto_mask_path}')
+
+        rotation_bank = _get_rotation_bank(task.rotation_step, task.rotation_cache_mb)
+        bank_key = key[:-1]
+
+        # Cenas com vários objetos sorteiam de um conjunto de objetos: os de
+        # todas as fontes (mix_sources) ou só os deste quadro
+        pool = None
+        if task.pool is not None:
+            pool = _load_pool(task)
+        elif task.objects_per_image > 1:
+            pool = [(image, object_mask, img_file, n, (bank_key, n)) for n, (image, object_mask) in enumerate(objects)]
+
+        if task.roi_only:
+            # Uma cópia do fundo por tela, reaproveitada entre as amostras: só a
+            # região colada muda e ela é restaurada depois que a amostra é gravada
+            slots = [[fundo_sem_objeto.copy(), np.zeros(fundo_sem_objeto.shape[:2], dtype=np.uint8), [], None]
+                     for _ in range(canvases)]
+            for n, i in enumerate(range(task.start, task.stop)):
+                slot = slots[n % canvases]
+                canvas, canvas_mask, in_flight, rois = slot
+                wait([f for f in in_flight if f is not None])
+                for x, y, w, h in rois or ():
+                    canvas[y:y+h, x:x+w] = fundo_sem_objeto[y:y+h, x:x+w]
+                    canvas_mask[y:y+h, x:x+w] = 0
+
+                rng = _task_rng(task.seed, img_file, i)
+                info, slot[3] = compose_into(canvas, canvas_mask, rng)
+
+                output_object_path, output_mask_path = output_paths(i)
+
+                slot[2] = [writer.write(output_object_path, canvas, image_params),
+                           writer.write(output_mask_path, canvas_mask, mask_params)]
+                add_metadata(i, info)
+            return True
+
+        if batch_size > 1 and pool is None:
+            height, width = fundo_sem_objeto.shape[:2]
+            # Dois conjuntos de buffers: um é composto enquanto o outro é gravado
+            buffers = [(np.empty((batch_size, height, width, 3), dtype=np.uint8),
+                        np.empty((batch_size, height, width), dtype=np.uint8)) for _ in range(2)]
+            in_flight = [[], []]
+            for n, batch_start in enumerate(range(task.start, task.stop, batch_size)):
+                slot = n % 2
+                wait([f for f in in_flight[slot] if f is not None])
+                out_images, out_masks = buffers[slot]
+                indices = range(batch_start, min(batch_start + batch_size, task.stop))
+                rngs = [_task_rng(task.seed, img_file, i) for i in indices]
+                infos = _compose_batch(fundo_sem_objeto, objects, rngs, out_images, out_masks,
+                                       rotation_bank, bank_key, placement, tracer, task.transform)
+                in_flight[slot] = []
+                for k, i in enumerate(indices):
+                    output_object_path, output_mask_path = output_paths(i)
+
+                    in_flight[slot].append(writer.write(output_object_path, out_images[k], image_params))
+                    in_flight[slot].append(writer.write(output_mask_path, out_masks[k], mask_params))
+                    add_metadata(i, infos[k])
+            return True
+
+        for i in range(task.start, task.stop):
+            rng = _task_rng(task.seed, img_file, i)
+            with tracer.stage('copy'):
+                img_variacao = fundo_sem_objeto.copy()
+                mask_variacao = np.zeros(fundo_sem_objeto.shape[:2], dtype=np.uint8)
+            info, _ = compose_into(img_variacao, mask_variacao, rng)
+
+            output_object_path, output_mask_path = output_paths(i)
+
+            writer.write(output_object_path, img_variacao, image_params)
+            writer.write(output_mask_path, mask_variacao, mask_params)
+            add_metadata(i, info)
+
+    return True
+
+def _as_transform(transform):
+    """Aceita um ``ObjectTransform``, um dict com seus argumentos ou None (padrão)."""
+    if transform is None:
+        return DEFAULT_TRANSFORM
+    if isinstance(transform, dict):
+        return ObjectTransform.from_dict(transform)
+    return transform
+
+def _frames_in_budget(budget, pixels):
+    """Quantas amostras completas cabem no orçamento além do fundo preparado."""
+    return (budget - _BACKGROUND_BYTES_PER_PIXEL * pixels) // (_FRAME_BYTES_PER_PIXEL * pixels)
+
+def _source_pixels(image_dir, img_file, target_size):
+    """Pixels por quadro: ``target_size`` ou, na resolução nativa, os da imagem."""
+    if target_size is not None:
+        return target_size[0] * target_size[1]
+    if is_video(image_dir):
+        frames = VideoFrames(image_dir)
+        return frames.width * frames.height
+    img = cv2.imread(os.path.join(image_dir, img_file), cv2.IMREAD_UNCHANGED)
+    return img.shape[0] * img.shape[1] if img is not None else 0
+
+class _SampleMembers:
+    """
+    Reúne os membros ``(nome, bytes)`` de uma tarefa, que chegam em qualquer
+    ordem das threads de codificação, e entrega cada amostra completa a
+    ``add`` na ordem da tarefa (fundo sem objeto, var1, var2, ...). Só as
+    amostras ainda incompletas ou fora de ordem ficam em memória, e a ordem
+    dos membros nos shards não depende do escalonamento nem do tamanho dos
+    blocos.
+    """
+
+    def __init__(self, task, add):
+        name = _sample_name(task.img_file, shards=True)
+        # Chaves das amostras na ordem da tarefa e quantos membros cada uma tem
+        self._expected = [(f'{name}_var{i+1}', 3) for i in range(task.start, task.stop)]
+        background = _background_file(task.image_dir, task.img_file, task.img_index)
+        if task.start == 0 and background is not None:
+            self._expected.insert(0, (f'fundo_sem_objeto_{_sample_name(background, shards=True)}', 2))
+        self._next = 0
+        self._groups = {}
+        self._add = add
+        self._lock = threading.Lock()
+
+    def append(self, member):
+        with self._lock:
+            self._groups.setdefault(sample_key(member[0]), []).append(member)
+            while self._next < len(self._expected):
+                key, count = self._expected[self._next]
+                if len(self._groups.get(key, ())) < count:
+                    break
+                self._add(self._groups.pop(key))
+                self._next += 1
+
+    def close(self):
+        """Entrega as amostras incompletas que restarem (fundo pulado, erro)."""
+        with self._lock:
+            for key, _ in self._expected[self._next:]:
+                if key in self._groups:
+                    self._add(self._groups.pop(key))
+            for key in list(self._groups):
+                self._add(self._groups.pop(key))
+            self._next = len(self._expected)
+
+def _run_task_in_worker(task):
+    """Ponto de entrada dos processos do pool: devolve os logs para o processo principal."""
+    messages = []
+    tracer = _task_tracer(task)
+    members = None
+    collector = None
+    if task.writer is not None and task.writer.shards:
+        members = []
+        collector = _SampleMembers(task, members.extend)
+    with worker_profiled(task.profile):
+        ok = _run_task(task, messages.append, tracer, collector)
+    if collector is not None:
+        collector.close()
+    return task, ok, messages, tracer.to_dict() if task.trace else None, members
+
+def process_images(image_dir, mask_dir, output_dir, num_fundos, num_ratos_por_fundo, log_widget=None,
+                   workers=1, seed=None, chunk_size=None, progress=None, batch_size=1,
+                   rotation_step=None, rotation_cache_mb=256, image_format='png', image_quality=None,
+                   mask_compression=None, writer_threads=2, max_pending_writes=16, avoid_overlap=False,
+                   instances=False, min_instance_area=64, object_bank=None, tracer=None, profile=None,
+                   resume=False, sink='dirs', shard_size=1000, target_size=TARGET_SIZE, roi_only=False,
+                   memory_budget_mb=None, transform=None, objects_per_image=1, mix_sources=False,
+                   max_overlap=0.0, part_index=0, num_parts=1, background_fill='patch', frame_stride=1,
+                   output_layout=DEFAULT_LAYOUT):
+    """
+    Processa as imagens com as pastas especificadas pelo usuário.
+    
+    Args:
+        image_dir: Pasta com as imagens originais, ou um arquivo de vídeo.
+            Os quadros do vídeo são decodificados numa thread, sem passar
+            pelo disco, e se chamam ``frame_00001.png``, ``frame_00002.png``...
+            (numerados como no ``ffmpeg``); o fundo de todos eles é o fundo
+            limpo do clipe, estimado uma vez por mediana temporal
+        mask_dir: Pasta com as máscaras correspondentes (para vídeos, com os
+            nomes dos quadros), ou um vídeo de máscaras com os mesmos quadros
+            gravado com um codec sem perdas
+        output_dir: Pasta de saída para os resultados
+        num_fundos: Número de fundos a processar (None processa todos). Para
+            vídeos, é o número máximo de quadros, espalhados pelo clipe
+        num_ratos_por_fundo: Número de variações por fundo
+        log_widget: Objeto com método ``append(text)`` para exibir logs
+            (``repaint()`` é chamado se existir)
+        workers: Número de processos de geração (None usa todos os núcleos)
+        seed: Semente base; com a mesma semente a saída é idêntica para
+            qualquer número de workers (None sorteia uma semente)
+        chunk_size: Variações por tarefa enviada ao pool (None escolhe
+            automaticamente para distribuir os fundos entre os workers)
+        progress: Função chamada com cada mensagem de progresso
+        batch_size: Variações compostas de uma vez em buffers pré-alocados;
+            acima de 1 usa a colagem vetorizada (mesmo resultado, menos cópias)
+        rotation_step: Resolução em graus do banco de rotações; os ângulos
+            sorteados são arredondados para ela e cada rotação de um objeto é
+            calculada só uma vez (None desativa o banco)
+        rotation_cache_mb: Memória máxima do banco de rotações por processo
+        image_format: Formato das imagens geradas: 'png', 'jpg' ou 'webp'
+            (as máscaras são sempre PNG, sem perdas)
+        image_quality: Compressão PNG (0-9) ou qualidade JPEG/WebP (0-100);
+            None usa o padrão do OpenCV
+        mask_compression: Nível de compressão PNG das máscaras (0-9)
+        writer_threads: Threads que codificam e gravam em paralelo com a
+            composição (0 grava de forma síncrona)
+        max_pending_writes: Máximo de imagens aguardando gravação por processo
+        avoid_overlap: Cola os objetos apenas em regiões sem primeiro plano
+            na máscara original
+        instances: Separa os objetos em instâncias (componentes conexos),
+            cada uma com seu próprio recorte; cada variação cola uma delas.
+            Com False, todos os objetos do quadro formam um único recorte
+        min_instance_area: Área mínima em pixels de uma instância colável
+        object_bank: Pasta de um banco de objetos persistente. Os objetos e
+            fundos extraídos são guardados nele e reaproveitados (mapeados em
+            memória) por execuções seguintes; só fontes novas ou alteradas são
+            extraídas de novo. O preenchimento do fundo fica fixo no banco
+        tracer: ``Tracer`` que recebe os tempos de cada etapa (load, extract,
+            background, rotate, composite, encode, write) e os contadores;
+            com workers, os tempos de cada processo são somados a ele
+        profile: Caminho de um arquivo ``.prof`` do cProfile para a execução;
+            com workers, cada processo grava ``{profile}.worker-{pid}``
+        resume: Retoma uma execução anterior na mesma pasta de saída usando o
+            ``manifest.json``: variações já concluídas são puladas e só fontes
+            novas ou alteradas, ou parâmetros diferentes, geram trabalho. Com
+            ``seed`` None, reaproveita a semente registrada. O manifesto é
+            sempre gravado, com ou sem ``resume``
+        sink: Saída das amostras: 'dirs' grava arquivos soltos em
+            ``fundos_sem_objeto/``, ``novos_objetos/`` e ``mascaras/``;
+            'shards' grava shards tar no formato do WebDataset em ``shards/``
+            (``{chave}.png``, ``{chave}.mask.png`` e ``{chave}.json`` com os
+            metadados), com um ``index.json`` das posições de cada membro.
+            Os pontos do nome da fonte são codificados nas chaves
+            (``cam.v0.jpg`` gera ``cam%2Ev0_var1``) e o fundo sem objeto usa
+            ``image_format``
+        shard_size: Número de amostras por shard
+        target_size: Tamanho ``(largura, altura)`` para o qual as fontes são
+            redimensionadas; None mantém a resolução nativa de cada fonte
+        roi_only: Mantém uma única cópia do fundo por worker (duas telas) e
+            altera só a região do objeto colado, restaurando-a depois que a
+            amostra é gravada, em vez de copiar o quadro inteiro por variação.
+            O resultado é idêntico; indicado para fontes 4K/8K
+        memory_budget_mb: Memória máxima estimada para a execução inteira. O
+            número de workers é reduzido até caber (estimado pela primeira
+            fonte) e cada worker limita lotes, telas e fila de gravação ao
+            que cabe na sua parte do orçamento, conforme o tamanho real de
+            cada fundo
+        transform: ``ObjectTransform`` (ou dict com os mesmos argumentos)
+            com rotação, escala, espelhamento, brilho/contraste e modo de
+            mesclagem dos objetos; None usa só a rotação aleatória
+        objects_per_image: Número de objetos colados em cada imagem gerada.
+            Acima de 1, os metadados de cada imagem (origem, transformação e
+            ordem de oclusão de cada objeto) são gravados em ``metadados/``
+        mix_sources: Sorteia os objetos de todas as fontes selecionadas, não
+            só do próprio quadro. Os objetos são compartilhados com os
+            workers pelo banco de objetos (``object_bank``, ou um banco
+            temporário apagado ao final)
+        max_overlap: Fração máxima dos pixels de um objeto que pode cobrir
+            objetos já colados na mesma imagem (0 rejeita qualquer colisão)
+        part_index: Parte do dataset gerada por esta execução (0 a
+            ``num_parts - 1``)
+        num_parts: Número de partes em que o dataset é dividido. As
+            variações de todos os fundos são numeradas em sequência e cada
+            parte gera um intervalo contíguo delas, então nós diferentes de
+            um cluster podem gerar partes diferentes sem coordenação. Exige
+            ``seed`` e uma pasta de saída por parte; juntas, as partes são
+            idênticas a uma única execução com a mesma semente. Não têm
+            relação com os arquivos tar de ``sink='shards'``; na linha de
+            comando, são ``--shard-index`` e ``--num-shards``
+        background_fill: Reconstrução do fundo sob os objetos. 'patch' copia
+            um pedaço de fundo limpo do tamanho de cada objeto e pula o
+            quadro se não achar nenhum; 'telea' e 'ns' usam ``cv2.inpaint``
+            só em volta de cada objeto; 'pyramid' interpola em várias escalas
+            (indicado para objetos grandes); 'median' usa a mediana de até
+            16 quadros de uma câmera fixa, calculada uma vez por execução e
+            guardada em ``plates/`` no banco de objetos, se houver. Só
+            'patch' descarta quadros cheios. Vídeos sempre usam o fundo do clipe
+        frame_stride: Para vídeos, usa um quadro a cada ``frame_stride``
+        output_layout: Nomes das subpastas e prefixos do fundo sem objeto na
+            saída em pastas (um ``OutputLayout``); os shards não usam
+    """
+    def log(text):
+        if progress is not None:
+            progress(text)
+        if log_widget is not None:
+            log_widget.append(text)
+            if hasattr(log_widget, 'repaint'):
+                log_widget.repaint()
+
+    if not os.path.exists(image_dir):
+        log(f'❌ Pasta de imagens não encontrada: {image_dir}')
+        return
+    
+    if not os.path.exists(mask_dir):
+        log(f'❌ Pasta de máscaras não encontrada: {mask_dir}')
+        return
+    
+    if sink not in ('dirs', 'shards'):
+        log(f'❌ Saída não suportada: {sink}')
+        return
+
+    if not 0 <= part_index < num_parts:
+        log(f'❌ Parte {part_index} inválida para {num_parts} partes')
+        return
+
+    if background_fill not in FILL_MODES:
+        log(f'❌ Preenchimento de fundo não suportado: {background_fill}')
+        return
+
+    if num_parts > 1 and seed is None:
+        log('❌ A divisão em partes exige uma semente fixa (seed)')
+        return
+
+    if image_format not in IMAGE_FORMATS:
+        log(f'❌ Formato de imagem não suportado: {image_format}')
+        return
+
+    if rotation_step is not None and (rotation_step <= 0 or 360 % rotation_step):
+        log(f'❌ rotation_step deve dividir 360 graus, recebido {rotation_step}')
+        return
+
+    transform = _as_transform(transform)
+    if tracer is None:
+        tracer = NULL_TRACER
+
+    # Criar subpastas de saída
+    output_background_dir = os.path.join(output_dir, output_layout.background_dir)
+    output_objects_dir = os.path.join(output_dir, output_layout.objects_dir)
+    output_masks_dir = os.path.join(output_dir, output_layout.masks_dir)
+    output_metadata_dir = os.path.join(output_dir, output_layout.metadata_dir)
+    scene = objects_per_image > 1 or mix_sources
+    
+    if sink == 'dirs':
+        os.makedirs(output_background_dir, exist_ok=True)
+        os.makedirs(output_objects_dir, exist_ok=True)
+        os.makedirs(output_masks_dir, exist_ok=True)
+        if scene:
+            os.makedirs(output_metadata_dir, exist_ok=True)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    video = is_video(image_dir)
+    temp_dir = None
+    plate = None
+    if video:
+        # Os quadros vão direto para o banco de objetos, sem passar pelo disco
+        video_bank = object_bank
+        if video_bank is None:
+            temp_dir = tempfile.TemporaryDirectory(prefix='transforms_fake_')
+            video_bank = temp_dir.name
+        template = _Task(image_dir, mask_dir, None, None, 0, 0, target_size, None, 0, 0, instances=instances,
+                         min_instance_area=min_instance_area, object_bank=video_bank)
+        try:
+            image_files, video_masks, plate = _ingest_video(template, frame_stride, num_fundos, log, tracer)
+        except ValueError as e:
+            log(f'❌ {e}')
+            image_files = []
+        background_fill = 'patch'
+    else:
+        image_files = _list_image_files(image_dir)
+    log(f'🔎 Encontradas {len(image_files)} imagens para processar.')
+
+    if len(image_files) == 0:
+        log('❌ Nenhuma imagem encontrada na pasta especificada.')
+        if temp_dir is not None:
+            temp_dir.cleanup()
+        return
+
+    fundos_selecionados = image_files[:num_fundos]
+    if not fundos_selecionados:
+        log(f'❌ Nenhum fundo selecionado (num_fundos={num_fundos})')
+        if temp_dir is not None:
+            temp_dir.cleanup()
+        return
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+    manifest = RunManifest(output_dir)
+    if seed is None and resume and manifest.seed is not None:
+        seed = manifest.seed
+        log(f'🎲 Semente da execução anterior: {seed}')
+    elif seed is None:
+        seed = random.randrange(2**32)
+        log(f'🎲 Semente: {seed}')
+    manifest.seed = seed
+
+    mask_index = build_mask_index(mask_dir) if not video else None
+
+    memory_budget = None
+    if memory_budget_mb is not None:
+        budget = memory_budget_mb * 1024 * 1024
+        pixels = _source_pixels(image_dir, fundos_selecionados[0], target_size)
+        per_worker = (_BACKGROUND_BYTES_PER_PIXEL + _FRAME_BYTES_PER_PIXEL) * pixels
+        if rotation_step is not None:
+            per_worker += rotation_cache_mb * 1024 * 1024
+        fit = max(1, budget // max(per_worker, 1))
+        if fit < workers:
+            log(f'🧠 Orçamento de {memory_budget_mb} MB: usando {fit} workers em vez de {workers}')
+            workers = fit
+        memory_budget = budget // workers
+        if rotation_step is not None:
+            memory_budget -= rotation_cache_mb * 1024 * 1024
+
+    # Divide as variações de cada fundo em blocos para ocupar todos os workers
+    if chunk_size is None:
+        if workers == 1:
+            chunk_size = num_ratos_por_fundo
+        else:
+            total = -(-num_ratos_por_fundo * len(fundos_selecionados) // num_parts)
+            chunk_size = -(-total // (workers * 4))
+    if sink == 'shards' and workers > 1 and fundos_selecionados:
+        # As amostras de uma tarefa do pool voltam juntas ao processo principal
+        pixels = _source_pixels(image_dir, fundos_selecionados[0], target_size)
+        chunk_size = min(chunk_size, _SHARD_TASK_BYTES // max(_ENCODED_BYTES_PER_PIXEL * pixels, 1))
+    chunk_size = max(1, min(chunk_size, num_ratos_por_fundo))
+
+    output_dirs = (output_background_dir, output_objects_dir, output_masks_dir, output_metadata_dir)
+    writer = _WriterConfig(image_format, image_quality, mask_compression, writer_threads, max_pending_writes,
+                           sink == 'shards')
+    shard_writer = None
+    if sink == 'shards':
+        shard_writer = ShardWriter(os.path.join(output_dir, 'shards'), shard_size, append=resume)
+    trace = _trace_mode(tracer)
+    inputs = {}
+    for img_index, img_file in enumerate(fundos_selecionados):
+        # O sha1 do conteúdo só é calculado para retomar os fundos desta parte;
+        # nos outros casos as fontes são identificadas por mtime e tamanho
+        hashed = (resume and manifest.hashed(img_file)
+                  and _part_variations(img_index, len(fundos_selecionados), num_ratos_por_fundo,
+                                        part_index, num_parts) is not None)
+        fingerprint = manifest.content_hash if hashed else file_stamp
+        if video:
+            # Vídeos longos são identificados por mtime e tamanho, sem ler o arquivo inteiro
+            mask_file = video_masks[img_file]
+            inputs[img_file] = {
+                'image': file_stamp(image_dir) + [img_file], 'mask_file': mask_file,
+                'mask': (file_stamp(mask_dir) if is_video(mask_dir)
+                         else fingerprint(os.path.join(mask_dir, mask_file))),
+            }
+        else:
+            mask_file = match_mask(mask_index, img_file)
+            inputs[img_file] = {
+                'image': fingerprint(os.path.join(image_dir, img_file)), 'mask_file': mask_file,
+                'mask': fingerprint(os.path.join(mask_dir, mask_file)) if mask_file else None,
+            }
+        if not hashed:
+            inputs[img_file]['stamps'] = True
+    # Parâmetros que mudam o conteúdo gerado; workers, blocos e lotes não mudam
+    params = {
+        'target_size': list(target_size) if target_size else None, 'rotation_step': rotation_step,
+        'avoid_overlap': avoid_overlap, 'instances': instances, 'min_instance_area': min_instance_area,
+        'object_bank': object_bank, 'image_format': image_format, 'image_quality': image_quality,
+        'mask_compression': mask_compression, 'transform': transform.to_dict(),
+        'objects_per_image': objects_per_image, 'max_overlap': max_overlap, 'pool': None,
+        'background_fill': background_fill, 'frame_stride': frame_stride if video else None,
+    }
+    if mix_sources or background_fill == 'median':
+        # Com objetos ou fundo mediano de todas as fontes, qualquer fonte alterada muda todas as imagens
+        params['pool'] = hashlib.sha1(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    if video:
+        object_bank = template.object_bank
+    if (mix_sources or background_fill == 'median') and object_bank is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix='transforms_fake_')
+    if mix_sources and object_bank is None:
+        object_bank = temp_dir.name
+
+    if background_fill == 'median':
+        plate_tasks = [_Task(image_dir, mask_dir, None, img_file, img_index, len(fundos_selecionados),
+                             target_size, seed, 0, 0, mask_file=inputs[img_file]['mask_file'])
+                       for img_index, img_file in enumerate(fundos_selecionados)]
+        plate = os.path.join(object_bank or temp_dir.name, 'plates', _plate_id(plate_tasks))
+
+    existing = _existing_outputs(output_dirs, IMAGE_FORMATS[image_format], shard_writer, output_layout)
+    tasks = []
+    source_tasks = []
+    for img_index, img_file in enumerate(fundos_selecionados):
+        mask_file = inputs[img_file]['mask_file']
+        source_tasks.append(_Task(image_dir, mask_dir, output_dirs, img_file, img_index,
+                                  len(fundos_selecionados), target_size, seed, 0, 0, mask_file=mask_file,
+                                  instances=instances, min_instance_area=min_instance_area,
+                                  object_bank=object_bank, trace=trace, background_fill=background_fill,
+                                  plate=plate))
+        variations = _part_variations(img_index, len(fundos_selecionados), num_ratos_por_fundo,
+                                       part_index, num_parts)
+        if variations is None:
+            continue
+        done = manifest.begin(img_file, inputs[img_file], params, seed, resume)
+        if done is None:
+            log(f'⏭️ {img_file}: pulado na execução anterior, fontes sem alteração')
+            continue
+        pending = _pending_variations(img_file, variations, done, existing, shard_writer is not None,
+                                      _background_file(image_dir, img_file, img_index))
+        if done and len(pending) < len(variations):
+            tracer.count('variations_resumed', len(variations) - len(pending))
+            if not pending:
+                log(f'⏭️ {img_file}: {len(variations)} variações já geradas')
+                continue
+            log(f'⏭️ {img_file}: {len(variations) - len(pending)} variações já geradas, '
+                f'gerando {len(pending)}')
+        for start, stop in _chunk_ranges(pending, chunk_size):
+            tasks.append(_Task(image_dir, mask_dir, output_dirs, img_file, img_index,
+                               len(fundos_selecionados), target_size, seed, start, stop,
+                               batch_size=batch_size, rotation_step=rotation_step,
+                               rotation_cache_mb=rotation_cache_mb, writer=writer,
+                               mask_file=mask_file, avoid_overlap=avoid_overlap,
+                               instances=instances, min_instance_area=min_instance_area,
+                               object_bank=object_bank, trace=trace,
+                               profile=profile if workers > 1 else None,
+                               roi_only=roi_only, memory_budget=memory_budget, transform=transform,
+                               objects_per_image=objects_per_image, max_overlap=max_overlap,
+                               background_fill=background_fill, plate=plate, layout=output_layout))
+
+    try:
+        with profiled(profile), tracer.stage('run'), \
+                ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+            if background_fill == 'median':
+                _build_plates(plate_tasks, plate, log, tracer)
+            if video:
+                # Os quadros do vídeo já foram guardados no banco durante a leitura
+                kept = source_tasks
+            elif object_bank is not None:
+                # Com mix_sources, todas as fontes entram no sorteio, mesmo as já concluídas
+                kept = _fill_object_bank(ObjectBank(object_bank), source_tasks if mix_sources else tasks,
+                                         pool, log, tracer)
+            if object_bank is not None:
+                usable = {task.img_file for task in kept}
+                for task in tasks:
+                    if task.img_file not in usable:
+                        manifest.mark_skipped(task.img_file)
+                tasks = [task for task in tasks if task.img_file in usable]
+                if mix_sources:
+                    pool_keys = tuple(_bank_key(task) for task in kept)
+                    tasks = [task._replace(pool=pool_keys) for task in tasks]
+            if pool is not None:
+                log(f'⚙️ Distribuindo {len(tasks)} tarefas entre {workers} workers...')
+            _run_tasks(tasks, pool, num_ratos_por_fundo, log, tracer, manifest, shard_writer, workers)
+    finally:
+        # Fecha o último shard antes do manifesto, que só vale para o que está no índice
+        if shard_writer is not None:
+            shard_writer.close()
+        manifest.save()
+        _clear_caches()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+def _existing_outputs(output_dirs, image_ext, shard_writer=None, layout=DEFAULT_LAYOUT):
+    """
+    Chaves das amostras já gravadas por completo (imagem e máscara), como
+    ``{nome}_var{i+1}`` e ``fundo_sem_objeto_{nome}`` (qualquer que seja o
+    prefixo do ``layout``). Cada pasta de saída é lida uma única vez; na
+    saída em shards, as chaves vêm do índice.
+    """
+    if shard_writer is not None:
+        return shard_writer.keys()
+    backgrounds, objects, masks = ({entry.name for entry in os.scandir(path)} for path in output_dirs[:3])
+    prefix = layout.background_prefix
+    keys = set()
+    for f in backgrounds:
+        if f.startswith(prefix) and f'{layout.background_mask_prefix}{f[len(prefix):]}' in masks:
+            keys.add('fundo_sem_objeto_' + os.path.splitext(f[len(prefix):])[0])
+    for f in objects:
+        base, ext = os.path.splitext(f)
+        if ext == image_ext and f'{base}_mask.png' in masks:
+            keys.add(base)
+    return keys
+
+def _part_variations(img_index, num_fundos, num_variations, part_index, num_parts):
+    """
+    Variações de um fundo que pertencem à parte ``part_index``, ou None se
+    nenhuma pertence. As variações de todos os fundos são numeradas em
+    sequência e divididas em ``num_parts`` intervalos contíguos de tamanhos
+    que diferem no máximo em um.
+    """
+    if num_variations == 0:
+        # Sem variações, cada parte grava os fundos sem objeto que lhe cabem
+        return range(0) if img_index % num_parts == part_index else None
+    total = num_fundos * num_variations
+    first = total * part_index // num_parts
+    last = total * (part_index + 1) // num_parts
+    offset = img_index * num_variations
+    start, stop = max(first - offset, 0), min(last - offset, num_variations)
+    if start >= stop:
+        return None
+    return range(start, stop)
+
+def _background_file(image_dir, img_file, img_index):
+    """
+    Nome (como o de uma fonte) do fundo sem objeto gravado pelo primeiro
+    bloco de um fundo, ou None se ele não grava nenhum. Os quadros de um
+    vídeo têm todos o fundo do clipe, gravado uma única vez, com o nome do
+    vídeo, pelo primeiro quadro.
+    """
+    if is_video(image_dir):
+        if img_index != 0:
+            return None
+        return os.path.splitext(os.path.basename(image_dir))[0] + '.png'
+    return img_file
+
+def _sample_name(img_file, shards=False):
+    """
+    Nome-base das amostras de um fundo: o nome da fonte sem a extensão e,
+    nos shards, sem pontos (veja ``shards.key_stem``).
+    """
+    name = os.path.splitext(img_file)[0]
+    return key_stem(name) if shards else name
+
+def _pending_variations(img_file, variations, done, existing, shards=False, background=None):
+    """
+    Índices de ``variations`` que ainda precisam ser geradas: os que não
+    constam no manifesto ou cujos arquivos sumiram da saída. A variação 0
+    também regrava o fundo sem objeto ``background`` (veja
+    ``_background_file``), então depende dele.
+    """
+    name = _sample_name(img_file, shards)
+    background_ok = background is None or f'fundo_sem_objeto_{_sample_name(background, shards)}' in existing
+    pending = []
+    for i in variations:
+        ok = i in done and f'{name}_var{i+1}' in existing and (i > 0 or background_ok)
+        if not ok:
+            pending.append(i)
+    if len(variations) == 0 and not background_ok:
+        # Sem variações, a tarefa [0, 0) ainda grava o fundo sem objeto
+        pending.append(0)
+    return pending
+
+def _chunk_ranges(indices, chunk_size):
+    """Agrupa índices ordenados em intervalos contíguos ``[início, fim)`` de até ``chunk_size``."""
+    ranges = []
+    for i in indices:
+        if ranges and ranges[-1][1] == i and ranges[-1][1] - ranges[-1][0] < chunk_size:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return [(start, stop) for start, stop in ranges]
+
+def _run_tasks(tasks, pool, num_ratos_por_fundo, log, tracer=NULL_TRACER, manifest=None, shard_writer=None,
+               workers=1):
+    """
+    Executa as tarefas (no pool, se houver) e registra cada fundo concluído.
+    Na saída em shards, sem pool as amostras vão direto para os shards assim
+    que são codificadas; com pool, o processo principal grava as amostras de
+    cada tarefa na ordem das tarefas, com no máximo duas tarefas por worker
+    em andamento.
+    """
+    pending = {}
+    for task in tasks:
+        pending[task.img_file] = pending.get(task.img_file, 0) + 1
+
+    def finish(task, ok):
+        if manifest is not None:
+            if ok:
+                manifest.mark_done(task.img_file, task.start, task.stop)
+            else:
+                manifest.mark_skipped(task.img_file)
+            manifest.save(force=False)
+        pending[task.img_file] -= 1
+        if ok and pending[task.img_file] == 0:
+            log(f'✅ Processado {task.img_file} - {num_ratos_por_fundo} variações de objeto criadas com máscaras e rotação.')
+
+    if pool is None:
+        for task in tasks:
+            members = _SampleMembers(task, shard_writer.add) if shard_writer is not None else None
+            ok = _run_task(task, log, tracer, members)
+            if members is not None:
+                members.close()
+            finish(task, ok)
+        return
+
+    def collect(future):
+        task, ok, messages, stats, members = future.result()
+        if stats is not None:
+            # Os tempos dos workers são somados ao tracer do processo principal
+            tracer.merge(stats)
+        for text in messages:
+            log(text)
+        if members:
+            shard_writer.add(members)
+        finish(task, ok)
+
+    if shard_writer is None:
+        for future in as_completed([pool.submit(_run_task_in_worker, task) for task in tasks]):
+            collect(future)
+        return
+
+    # Shards: resultados na ordem das tarefas, com uma janela limitada de
+    # tarefas submetidas para não acumular amostras prontas fora de ordem
+    window = 2 * workers
+    futures = deque()
+    for task in tasks:
+        if len(futures) >= window:
+            collect(futures.popleft())
+        futures.append(pool.submit(_run_task_in_worker, task))
+    while futures:
+        collect(futures.popleft())
+
+def iter_synthetic_samples(image_dir, mask_dir, num_fundos, num_ratos_por_fundo, seed=None, progress=None,
+                           rotation_step=None, rotation_cache_mb=256, avoid_overlap=False,
+                           instances=False, min_instance_area=64, object_bank=None, tracer=None,
+                           target_size=TARGET_SIZE, transform=None, objects_per_image=1, max_overlap=0.0,
+                           background_fill='patch', frame_stride=1):
+    """
+    Gera amostras sintéticas em memória, sem gravar nada em disco.
+
+    O gerador é preguiçoso: apenas um fundo fica carregado por vez e cada
+    amostra é produzida quando solicitada, então a memória usada não cresce
+    com o tamanho do dataset. Com a mesma semente, as amostras são idênticas
+    às gravadas por ``process_images``.
+
+    Args:
+        image_dir: Pasta com as imagens originais, ou um arquivo de vídeo
+            (veja ``process_images``)
+        mask_dir: Pasta com as máscaras correspondentes, ou um vídeo de máscaras
+        num_fundos: Número de fundos (ou quadros do vídeo) a processar
+        num_ratos_por_fundo: Número de variações por fundo
+        seed: Semente base (None sorteia uma semente)
+        progress: Função chamada com cada mensagem de progresso
+        rotation_step: Resolução em graus do banco de rotações (None desativa)
+        rotation_cache_mb: Memória máxima do banco de rotações
+        avoid_overlap: Cola os objetos apenas em regiões sem primeiro plano
+            na máscara original
+        instances: Separa os objetos em instâncias (componentes conexos)
+        min_instance_area: Área mínima em pixels de uma instância colável
+        object_bank: Pasta de um banco de objetos persistente (veja
+            ``process_images``)
+        tracer: ``Tracer`` que recebe os tempos de cada etapa e os contadores
+        target_size: Tamanho ``(largura, altura)`` das amostras; None mantém a
+            resolução nativa de cada fonte
+        transform: ``ObjectTransform`` (ou dict) aplicado aos objetos
+        objects_per_image: Número de objetos colados em cada amostra,
+            sorteados entre os objetos do próprio fundo
+        max_overlap: Fração máxima de cada objeto que pode ficar coberta
+            pelos objetos já colados na mesma amostra
+        background_fill: Reconstrução do fundo sob os objetos: 'patch',
+            'telea', 'ns', 'pyramid' ou 'median' (veja ``process_images``)
+        frame_stride: Para vídeos, usa um quadro a cada ``frame_stride``
+
+    Yields:
+        Tuplas (image, mask, metadata): imagem BGR ``(H, W, 3)``, máscara
+        ``(H, W)`` com as classes originais e um dict com a origem
+        (``source``, ``variation``, ``seed``) e a transformação aplicada.
+    """
+    log = progress if progress is not None else (lambda text: None)
+    if seed is None:
+        seed = random.randrange(2**32)
+        log(f'🎲 Semente: {seed}')
+
+    rotation_bank = None
+    if rotation_step is not None:
+        rotation_bank = RotationBank(rotation_step, rotation_cache_mb * 1024 * 1024)
+
+    bank = ObjectBank(object_bank) if object_bank is not None else None
+    if tracer is None:
+        tracer = NULL_TRACER
+    transform = _as_transform(transform)
+
+    if background_fill not in FILL_MODES:
+        raise ValueError(f'Preenchimento de fundo não suportado: {background_fill}')
+
+    video = is_video(image_dir)
+    # Os quadros do vídeo e o fundo mediano são preparados uma vez, antes da primeira amostra
+    temp_dir = None
+    if (video or background_fill == 'median') and object_bank is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix='transforms_fake_')
+    try:
+        if video:
+            template = _Task(image_dir, mask_dir, None, None, 0, 0, target_size, seed, 0, num_ratos_por_fundo,
+                             instances=instances, min_instance_area=min_instance_area,
+                             object_bank=object_bank or temp_dir.name, trace=_trace_mode(tracer),
+                             avoid_overlap=avoid_overlap)
+            names, video_masks, plate = _ingest_video(template, frame_stride, num_fundos, log, tracer)
+            tasks = [template._replace(img_file=name, img_index=img_index, num_fundos=len(names),
+                                       mask_file=video_masks[name], plate=plate)
+                     for img_index, name in enumerate(names)]
+        else:
+            fundos_selecionados = _list_image_files(image_dir)[:num_fundos]
+            mask_index = build_mask_index(mask_dir)
+            tasks = [_Task(image_dir, mask_dir, None, img_file, img_index, len(fundos_selecionados),
+                           target_size, seed, 0, num_ratos_por_fundo, mask_file=match_mask(mask_index, img_file),
+                           instances=instances, min_instance_area=min_instance_area, object_bank=object_bank,
+                           trace=_trace_mode(tracer), background_fill=background_fill,
+                           avoid_overlap=avoid_overlap)
+                     for img_index, img_file in enumerate(fundos_selecionados)]
+
+        if background_fill == 'median' and not video:
+            plate = os.path.join(object_bank or temp_dir.name, 'plates', _plate_id(tasks))
+            _build_plates(tasks, plate, log, tracer)
+            tasks = [task._replace(plate=plate) for task in tasks]
+
+        for task in tasks:
+            img_file = task.img_file
+            if video:
+                with tracer.stage('load', source=img_file):
+                    prepared = _load_from_bank(task)
+            elif object_bank is not None:
+                if not _fill_object_bank(bank, [task], None, log, tracer):
+                    continue
+                with tracer.stage('load', source=img_file):
+                    prepared = _load_from_bank(task)
+            else:
+                prepared = _prepare_background(task, log, tracer)
+            if prepared is None:
+                continue
+
+            placement = prepared.free_space if avoid_overlap else None
+            pool = None
+            if objects_per_image > 1:
+                pool = [(image, object_mask, img_file, n, (img_file, n))
+                        for n, (image, object_mask) in enumerate(prepared.objects)]
+            for i in range(num_ratos_por_fundo):
+                rng = _task_rng(seed, img_file, i)
+                if pool is None:
+                    img_variacao, mask_variacao, info = _compose_variation(
+                        prepared.fundo_sem_objeto, prepared.objects, rng, rotation_bank, img_file, placement,
+                        tracer, transform)
+                else:
+                    with tracer.stage('copy'):
+                        img_variacao = prepared.fundo_sem_objeto.copy()
+                        mask_variacao = np.zeros(img_variacao.shape[:2], dtype=np.uint8)
+                    info = _compose_scene(img_variacao, mask_variacao, pool, objects_per_image, rng,
+                                          rotation_bank, placement, tracer, transform, max_overlap)
+                metadata = {'source': img_file, 'variation': i, 'seed': seed}
+                metadata.update(info)
+                yield img_variacao, mask_variacao, metadata
+    finally:
+        _clear_caches()
+        if temp_dir is not None:
+            temp_dir.cleanup()
@@ -0,0 +1,168 @@
+"""
+Instrumentação do pipeline: tempos por estágio, contadores, hooks e profiling.
+
+Um ``Tracer`` passado para ``process_images`` acumula, para cada estágio
+(leitura, extração, preenchimento do fundo, rotação, composição, codificação
+e gravação), o número de execuções e os tempos total, mínimo e máximo, além
+de contadores como imagens puladas e bytes gravados. Os resultados podem ser
+exportados com ``to_dict`` ou ``to_json``.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+class Tracer:
+    """
+    Coleta tempos por estágio e contadores de uma execução.
+
+    Hooks são objetos com métodos opcionais ``on_stage_start(name, info)`` e
+    ``on_stage_end(name, seconds, info)``. Numa execução serial eles são
+    chamados em tempo real (os estágios ``encode`` e ``write`` rodam nas
+    threads de gravação); com vários workers, os eventos de cada tarefa são
+    repassados aos hooks no processo principal quando a tarefa termina.
+
+    Args:
+        hooks: Lista de objetos de hook
+        record_events: Guarda a sequência de eventos para ``merge`` (usado
+            internamente pelos workers)
+    """
+
+    def __init__(self, hooks=(), record_events=False):
+        self.hooks = list(hooks)
+        self.stages = {}
+        self.counters = {}
+        self.events = [] if record_events else None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **info):
+        """Mede o bloco ``with`` como uma execução do estágio ``name``."""
+        for hook in self.hooks:
+            if hasattr(hook, 'on_stage_start'):
+                hook.on_stage_start(name, info)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, info)
+
+    def add_time(self, name, seconds, info=None):
+        """Registra uma execução de ``seconds`` segundos do estágio ``name``."""
+        info = info or {}
+        with self._lock:
+            self._add_stage(name, 1, seconds, seconds, seconds)
+            if self.events is not None:
+                self.events.append((name, seconds, info))
+        for hook in self.hooks:
+            if hasattr(hook, 'on_stage_end'):
+                hook.on_stage_end(name, seconds, info)
+
+    def count(self, name, value=1):
+        """Soma ``value`` ao contador ``name``."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, data):
+        """Incorpora o ``to_dict()`` de outro tracer (por exemplo, de um worker)."""
+        with self._lock:
+            for name, stats in data['stages'].items():
+                self._add_stage(name, stats['count'], stats['total_s'], stats['min_s'], stats['max_s'])
+            for name, value in data['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+        for name, seconds, info in data.get('events') or ():
+            for hook in self.hooks:
+                if hasattr(hook, 'on_stage_start'):
+                    hook.on_stage_start(name, info)
+                if hasattr(hook, 'on_stage_end'):
+                    hook.on_stage_end(name, seconds, info)
+
+    def to_dict(self):
+        """Métricas como dict serializável em JSON."""
+        with self._lock:
+            stages = {
+                name: {
+                    'count': count,
+                    'total_s': total,
+                    'mean_s': total / count if count else 0.0,
+                    'min_s': low,
+                    'max_s': high,
+                }
+                for name, (count, total, low, high) in self.stages.items()
+            }
+            data = {'stages': stages, 'counters': dict(self.counters)}
+            if self.events is not None:
+                data['events'] = list(self.events)
+        return data
+
+    def to_json(self, path=None, **kwargs):
+        """Métricas em JSON; grava em ``path`` se for informado."""
+        data = self.to_dict()
+        data.pop('events', None)
+        text = json.dumps(data, **kwargs)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def _add_stage(self, name, count, total, low, high):
+        if name in self.stages:
+            old_count, old_total, old_low, old_high = self.stages[name]
+            self.stages[name] = (old_count + count, old_total + total, min(old_low, low), max(old_high, high))
+        else:
+            self.stages[name] = (count, total, low, high)
+
+class _NullTracer:
+    """Tracer que não faz nada, usado quando a instrumentação está desligada."""
+
+    def stage(self, name, **info):
+        return nullcontext()
+
+    def add_time(self, name, seconds, info=None):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+NULL_TRACER = _NullTracer()
+
+@contextmanager
+def profiled(path):
+    """
+    Executa o bloco sob ``cProfile`` e grava as estatísticas em ``path``
+    (legíveis com ``pstats`` ou snakeviz). Com ``path`` None não faz nada.
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+# Profiler de cada processo worker, acumulado entre as tarefas que ele executa.
+_worker_profiler = None
+
+@contextmanager
+def worker_profiled(path):
+    """
+    Como ``profiled``, mas acumula todas as tarefas do processo atual e grava
+    em ``{path}.worker-{pid}`` ao fim de cada uma.
+    """
+    global _worker_profiler
+    if path is None:
+        yield
+        return
+    if _worker_profiler is None:
+        _worker_profiler = cProfile.Profile()
+    _worker_profiler.enable()
+    try:
+        yield
+    finally:
+        _worker_profiler.disable()
+        _worker_profiler.dump_stats(f'{path}.worker-{os.getpid()}')
@@ -1,186 +1,32 @@
 import sys
-import os
-import random
-import cv2
-import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QSpinBox,
     QVBoxLayout, QHBoxLayout, QTextEdit, QFileDialog, QLineEdit
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 
-def rotate_image_and_mask(image, mask, angle):
-    """Rotaciona a imagem e a máscara mantendo o mesmo tamanho."""
-    (h, w) = image.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    rotated_img = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0))
-    rotated_mask = cv2.warpAffine(mask, M, (w, h), flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
-    return rotated_img, rotated_mask
+# Reexportados para manter `from transforms_fake.main import process_images`
+from .core import process_images
+from .rotate_image_and_mask import rotate_image_and_mask
 
-def process_images(image_dir, mask_dir, output_dir, num_fundos, num_ratos_por_fundo, log_widget):
-    """
-    Processa as imagens com as pastas especificadas pelo usuário.
-    
-    Args:
-        image_dir: Pasta com as imagens originais
-        mask_dir: Pasta com as máscaras correspondentes
-        output_dir: Pasta de saída para os resultados
-        num_fundos: Número de fundos a processar
-        num_ratos_por_fundo: Número de variações por fundo
-        log_widget: Widget para exibir logs
-    """
-    if not os.path.exists(image_dir):
-        log_widget.append(f'❌ Pasta de imagens não encontrada: {image_dir}')
-        return
-    
-    if not os.path.exists(mask_dir):
-        log_widget.append(f'❌ Pasta de máscaras não encontrada: {mask_dir}')
-        return
-    
-    # Criar subpastas de saída
-    output_background_dir = os.path.join(output_dir, 'fundos_sem_objeto')
-    output_objects_dir = os.path.join(output_dir, 'novos_objetos')
-    output_masks_dir = os.path.join(output_dir, 'mascaras')
-    
-    os.makedirs(output_background_dir, exist_ok=True)
-    os.makedirs(output_objects_dir, exist_ok=True)
-    os.makedirs(output_masks_dir, exist_ok=True)
-    
-    target_size = (1428, 1068)
+# Limite dos campos numéricos: o maior valor de um QSpinBox
+MAX_SPIN_VALUE = 2**31 - 1
 
-    def log(text):
-        log_widget.append(text)
-        log_widget.repaint()
-        QApplication.processEvents()
+class ProcessingThread(QThread):
+    """Executa ``process_images`` fora da thread da interface."""
 
-    def get_matching_mask(img_filename, mask_dir):
-        base_name = os.path.splitext(img_filename)[0]
-        for f in os.listdir(mask_dir):
-            if os.path.splitext(f)[0] == base_name:
-                return f
-        return None
+    message = pyqtSignal(str)
 
-    def find_background_patch(mask, w, h, exclude_rect):
-        height, width = mask.shape
-        for attempt in range(1000):
-            x = random.randint(0, width - w)
-            y = random.randint(0, height - h)
-            ex, ey, ew, eh = exclude_rect
-            # Verifica se a região se sobrepõe ao objeto, se sim, pula
-            if (x < ex + ew and x + w > ex and y < ey + eh and y + h > ey):
-                continue
-            patch = mask[y:y+h, x:x+w]
-            if np.all(patch == 0):
-                return x, y
-        return None
+    def __init__(self, args, kwargs, parent=None):
+        super().__init__(parent)
+        self._args = args
+        self._kwargs = kwargs
 
-    image_files = sorted([f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-    log(f'🔎 Encontradas {len(image_files)} imagens para processar.')
-
-    if len(image_files) == 0:
-        log('❌ Nenhuma imagem encontrada na pasta especificada.')
-        return
-
-    fundos_selecionados = image_files[:num_fundos]
-    for img_index, img_file in enumerate(fundos_selecionados):
-        mask_file = get_matching_mask(img_file, mask_dir)
-        if mask_file is None:
-            log(f'⚠️ Nenhuma máscara encontrada para {img_file}, pulando...')
-            continue
-
-        img_path = os.path.join(image_dir, img_file)
-        mask_path = os.path.join(mask_dir, mask_file)
-
-        img = cv2.imread(img_path)
-        mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-
-        if img is None or mask is None:
-            log(f'⚠️ Erro ao abrir imagem ou máscara para {img_file}')
-            continue
-
-        img = cv2.resize(img, target_size)
-        mask = cv2.resize(mask, target_size, interpolation=cv2.INTER_NEAREST)
-
-        # Mascara binária para objeto (qualquer classe 1,2,3 vira 255)
-        object_mask = np.isin(mask, [1, 2, 3]).astype(np.uint8) * 255
-        object_mask_inv = cv2.bitwise_not(object_mask)
-
-        coords = cv2.findNonZero(object_mask)
-        if coords is None:
-            log(f'⚠️ Nenhum objeto encontrado na máscara de {img_file}, pulando...')
-            continue
-
-        x, y, w, h = cv2.boundingRect(coords)
-        log(f'Processando {img_file} ({img_index+1}/{len(fundos_selecionados)}), objeto bbox: x={x}, y={y}, w={w}, h={h}')
-
-        object_cropped = img[y:y+h, x:x+w]
-        object_mask_cropped = object_mask[y:y+h, x:x+w]
-        object_mask_original_cropped = mask[y:y+h, x:x+w]  # máscara original com classes 1,2,3
-
-        # Cria fundo sem objeto
-        fundo_sem_objeto = cv2.bitwise_and(img, img, mask=object_mask_inv)
-
-        # Encontra um patch do fundo para substituir a área do objeto no fundo_sem_objeto
-        patch_pos = find_background_patch(mask, w, h, (x, y, w, h))
-        if patch_pos is None:
-            log(f'⚠️ Não encontrou região de fundo adequada para preencher o objeto em {img_file}, pulando...')
-            continue
-
-        patch_x, patch_y = patch_pos
-        fundo_patch = img[patch_y:patch_y+h, patch_x:patch_x+w]
-        fundo_sem_objeto[y:y+h, x:x+w] = fundo_patch
-
-        # Salva a imagem do fundo sem objeto
-        fundo_sem_objeto_path = os.path.join(output_background_dir, f'fundo_sem_objeto_{img_file}')
-        cv2.imwrite(fundo_sem_objeto_path, fundo_sem_objeto)
-        log(f'Fundo sem objeto salvo: {fundo_sem_objeto_path}')
-
-        # SALVA MÁSCARA TODA ZERO PARA O FUNDO SEM OBJETO
-        fundo_sem_objeto_mask = np.zeros_like(mask, dtype=np.uint8)
-        fundo_sem_objeto_mask_path = os.path.join(output_masks_dir, f'fundo_sem_objeto_mask_{img_file}')
-        cv2.imwrite(fundo_sem_objeto_mask_path, fundo_sem_objeto_mask)
-        log(f'Máscara do fundo sem objeto salva: {fundo_sem_objeto_mask_path}')
-
-        max_x = target_size[0] - w
-        max_y = target_size[1] - h
-
-        for i in range(num_ratos_por_fundo):
-            img_variacao = fundo_sem_objeto.copy()
-            mask_variacao = np.zeros_like(mask, dtype=np.uint8)
-
-            # Rotação aleatória entre -180 e +180 graus (pode ajustar o range)
-            angle = random.uniform(-180, 180)
-            object_rotated, mask_rotated = rotate_image_and_mask(object_cropped, object_mask_original_cropped, angle)
-
-            # Ajusta as dimensões após rotação (mesmo tamanho, mas pode ter áreas pretas)
-            h_r, w_r = object_rotated.shape[:2]
-
-            # Escolhe uma posição aleatória onde o objeto rotacionado caiba na imagem
-            max_x_r = target_size[0] - w_r
-            max_y_r = target_size[1] - h_r
-            x_new = random.randint(0, max_x_r)
-            y_new = random.randint(0, max_y_r)
-
-            roi = img_variacao[y_new:y_new+h_r, x_new:x_new+w_r]
-            # Máscara binária para usar no bitwise_and (apenas 255/0)
-            mask_rotated_bin = (mask_rotated > 0).astype(np.uint8) * 255
-            roi_bg = cv2.bitwise_and(roi, roi, mask=cv2.bitwise_not(mask_rotated_bin))
-            object_fg = cv2.bitwise_and(object_rotated, object_rotated, mask=mask_rotated_bin)
-            dst = cv2.add(roi_bg, object_fg)
-            img_variacao[y_new:y_new+h_r, x_new:x_new+w_r] = dst
-
-            # Coloca a máscara rotacionada com as classes originais (1,2,3)
-            # Usando máscara rotacionada com classes originais, que pode conter valores 1,2,3 em vez de 255
-            mask_variacao[y_new:y_new+h_r, x_new:x_new+w_r] = mask_rotated
-
-            output_object_path = os.path.join(output_objects_dir, f'{os.path.splitext(img_file)[0]}_var{i+1}.png')
-            output_mask_path = os.path.join(output_masks_dir, f'{os.path.splitext(img_file)[0]}_var{i+1}_mask.png')
-
-            cv2.imwrite(output_object_path, img_variacao)
-            cv2.imwrite(output_mask_path, mask_variacao)
-
-        log(f'✅ Processado {img_file} - {num_ratos_por_fundo} variações de objeto criadas com máscaras e rotação.')
+    def run(self):
+        try:
+            process_images(*self._args, progress=self.message.emit, **self._kwargs)
+        except Exception as e:
+            self.message.emit(f"❌ Erro no processamento: {e}")
 
 class MainWindow(QWidget):
     def __init__(self):
@@ -192,6 +38,7 @@ class MainWindow(QWidget):
         self.image_dir = ""
         self.mask_dir = ""
         self.output_dir = ""
+        self.thread = None
 
         layout = QVBoxLayout()
 
@@ -242,7 +89,7 @@ class MainWindow(QWidget):
         hbox1.addWidget(QLabel("Número de fundos a usar:"))
         self.spin_fundos = QSpinBox()
         self.spin_fundos.setMinimum(1)
-        self.spin_fundos.setMaximum(100)
+        self.spin_fundos.setMaximum(MAX_SPIN_VALUE)
         self.spin_fundos.setValue(5)
         hbox1.addWidget(self.spin_fundos)
         layout.addLayout(hbox1)
@@ -252,7 +99,7 @@ class MainWindow(QWidget):
         hbox2.addWidget(QLabel("Número de objetos por fundo:"))
         self.spin_objetos = QSpinBox()
         self.spin_objetos.setMinimum(1)
-        self.spin_objetos.setMaximum(100)
+        self.spin_objetos.setMaximum(MAX_SPIN_VALUE)
         self.spin_objetos.setValue(10)
         hbox2.addWidget(self.spin_objetos)
         layout.addLayout(hbox2)
@@ -264,9 +111,9 @@ class MainWindow(QWidget):
         layout.addWidget(self.log_widget)
 
         # Botão de processar
-        btn_processar = QPushButton("🚀 Processar Imagens")
-        btn_processar.clicked.connect(self.start_processing)
-        layout.addWidget(btn_processar)
+        self.btn_processar = QPushButton("🚀 Processar Imagens")
+        self.btn_processar.clicked.connect(self.start_processing)
+        layout.addWidget(self.btn_processar)
 
         self.setLayout(layout)
 
@@ -317,8 +164,19 @@ class MainWindow(QWidget):
         self.log_widget.append(f"⚙️ Fundos: {num_fundos}, Objetos por fundo: {num_objetos}")
         self.log_widget.append("-" * 50)
         
-        process_images(self.image_dir, self.mask_dir, self.output_dir, 
-                      num_fundos, num_objetos, self.log_widget)
+        # O processamento roda numa QThread; as mensagens chegam pelo sinal
+        # e são exibidas na thread da interface, que continua respondendo
+        self.btn_processar.setEnabled(False)
+        self.thread = ProcessingThread((self.image_dir, self.mask_dir, self.output_dir, num_fundos, num_objetos),
+                                       {}, self)
+        self.thread.message.connect(self.log_widget.append)
+        self.thread.finished.connect(self.processing_finished)
+        self.thread.start()
+
+    def processing_finished(self):
+        """Reativa o botão quando o processamento termina."""
+        self.btn_processar.setEnabled(True)
+        self.thread = None
 
 def main():
     app = QApplication(sys.argv)
@@ -0,0 +1,130 @@
+"""
+Manifesto de execução para retomar gerações interrompidas.
+
+Os nomes dos arquivos gerados são determinísticos (``{nome}_var{i+1}``), então
+uma nova execução sobrescreveria tudo. O manifesto (``manifest.json`` na pasta
+de saída) guarda, para cada fundo, a identificação da imagem e da máscara, os
+parâmetros que afetam o resultado, a semente e as variações já concluídas.
+Com ``resume=True`` só é gerado o que falta ou o que mudou.
+
+As fontes são identificadas pelo hash do conteúdo só quando ele é usado
+(retomada dos fundos da parte atual); nos outros casos bastam o mtime e o
+tamanho, sem ler os arquivos.
+"""
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_FILE = 'manifest.json'
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_stamp(path):
+    """Identificação barata de um arquivo: ``[mtime_ns, tamanho]``."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+def _to_ranges(indices):
+    """Compacta índices em intervalos ``[início, fim)`` ordenados."""
+    ranges = []
+    for i in sorted(indices):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+class RunManifest:
+    """
+    Registro persistente do que já foi gerado numa pasta de saída.
+
+    Os hashes das fontes são recalculados apenas quando o mtime ou o tamanho
+    do arquivo mudam. O manifesto é gravado de forma atômica, no máximo a cada
+    ``save_interval`` segundos durante a execução, para que uma interrupção
+    perca pouco trabalho já feito.
+
+    Args:
+        output_dir: Pasta de saída da geração
+        save_interval: Intervalo mínimo em segundos entre gravações
+    """
+
+    def __init__(self, output_dir, save_interval=2.0):
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.save_interval = save_interval
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.seed = data.get('seed')
+            self.entries = data['entries']
+            self._hashes = data.get('hashes', {})
+        except (OSError, ValueError, KeyError):
+            self.seed = None
+            self.entries = {}
+            self._hashes = {}
+        self._last_save = 0.0
+
+    def content_hash(self, path):
+        """sha1 do conteúdo de ``path``, reaproveitado enquanto o arquivo não muda."""
+        stamp = file_stamp(path)
+        key = os.path.abspath(path)
+        cached = self._hashes.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = self._hashes[key] = [stamp, _file_sha1(path)]
+        return cached[1]
+
+    def hashed(self, img_file):
+        """
+        Indica se as fontes de ``img_file`` devem ser identificadas pelo
+        conteúdo: falso se a execução anterior as registrou por mtime e
+        tamanho, para que a retomada compare identificações do mesmo tipo.
+        """
+        entry = self.entries.get(img_file)
+        return entry is None or not entry['inputs'].get('stamps')
+
+    def begin(self, img_file, inputs, params, seed, resume=True):
+        """
+        Inicia o registro de um fundo.
+
+        Returns:
+            Conjunto de índices de variações já concluídas, ou None se o fundo
+            foi pulado numa execução anterior com as mesmas fontes. Sem
+            ``resume``, ou se fontes, parâmetros ou semente mudaram, o
+            registro é recomeçado e o conjunto volta vazio.
+        """
+        entry = self.entries.get(img_file)
+        if (resume and entry is not None and entry['inputs'] == inputs
+                and entry['params'] == params and entry['seed'] == seed):
+            if entry.get('skipped'):
+                return None
+            return {i for start, stop in entry['completed'] for i in range(start, stop)}
+        self.entries[img_file] = {'inputs': inputs, 'params': params, 'seed': seed, 'completed': []}
+        return set()
+
+    def mark_done(self, img_file, start, stop):
+        """Registra as variações ``[start, stop)`` de um fundo como concluídas."""
+        entry = self.entries[img_file]
+        done = {i for a, b in entry['completed'] for i in range(a, b)}
+        done.update(range(start, stop))
+        entry['completed'] = _to_ranges(done)
+
+    def mark_skipped(self, img_file):
+        """Registra que o fundo foi pulado (sem objeto válido na máscara)."""
+        self.entries[img_file]['skipped'] = True
+        self.entries[img_file]['completed'] = []
+
+    def save(self, force=True):
+        """Grava o manifesto de forma atômica (respeitando ``save_interval`` se não for ``force``)."""
+        now = time.monotonic()
+        if not force and now - self._last_save < self.save_interval:
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'seed': self.seed, 'entries': self.entries, 'hashes': self._hashes}, f)
+        os.replace(tmp_path, self.path)
+        self._last_save = now
@@ -0,0 +1,72 @@
+"""
+Índice nome da imagem → arquivo de máscara.
+
+Procurar a máscara de cada imagem com ``os.listdir`` custa O(N²) no tamanho
+do dataset. Aqui a pasta de máscaras é lida uma única vez com ``os.scandir``
+e o índice resultante é guardado em disco, associado ao mtime da pasta, para
+que execuções seguintes comecem sem reler a pasta.
+"""
+import hashlib
+import json
+import os
+
+# Sufixo aceito para máscaras, como em ``image1.png`` → ``image1_mask.png``
+MASK_SUFFIX = '_mask'
+
+def _cache_path(mask_dir):
+    cache_root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    digest = hashlib.sha1(os.path.abspath(mask_dir).encode('utf-8')).hexdigest()
+    return os.path.join(cache_root, 'transforms_fake', 'mask_index', f'{digest}.json')
+
+def _scan(mask_dir):
+    files = sorted(entry.name for entry in os.scandir(mask_dir)
+                   if entry.is_file() and not entry.name.startswith('.'))
+    index = {}
+    # Nome idêntico tem prioridade sobre o sufixo _mask
+    for f in files:
+        base_name = os.path.splitext(f)[0]
+        if base_name.endswith(MASK_SUFFIX):
+            index.setdefault(base_name[:-len(MASK_SUFFIX)], f)
+    for f in reversed(files):
+        index[os.path.splitext(f)[0]] = f
+    return index
+
+def build_mask_index(mask_dir, use_cache=True):
+    """
+    Monta o índice ``nome base da imagem → nome do arquivo de máscara``.
+
+    Para ``image1.png`` são aceitas as máscaras ``image1.<ext>`` e
+    ``image1_mask.<ext>``, nessa ordem de preferência.
+
+    Args:
+        mask_dir: Pasta com as máscaras
+        use_cache: Lê e grava o índice em ``~/.cache/transforms_fake``,
+            invalidado quando o mtime da pasta muda
+    """
+    mtime = os.stat(mask_dir).st_mtime_ns
+    cache_path = _cache_path(mask_dir)
+    if use_cache:
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('mtime_ns') == mtime:
+                return cached['index']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    index = _scan(mask_dir)
+
+    if use_cache:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'mask_dir': os.path.abspath(mask_dir), 'mtime_ns': mtime, 'index': index}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # Cache é opcional: pasta sem permissão de escrita não impede a execução
+    return index
+
+def match_mask(index, img_filename):
+    """Devolve o arquivo de máscara de ``img_filename`` ou None."""
+    return index.get(os.path.splitext(img_filename)[0])
@@ -0,0 +1,169 @@
+"""
+Banco persistente de objetos extraídos.
+
+Decodificar, redimensionar, segmentar e reconstruir o fundo de cada imagem
+custa caro e o resultado não depende dos parâmetros de geração. O banco
+guarda uma vez os recortes dos objetos, suas máscaras de classe e o fundo
+sem objeto num único arquivo binário (``objects.bin``), descrito por um
+índice JSON (``index.json``). Execuções seguintes, e os workers de uma mesma
+execução, mapeiam o arquivo em memória e leem os arrays sem cópia.
+
+Várias execuções podem compartilhar o mesmo banco (as partes de um job no
+cluster, por exemplo): os acréscimos ao arquivo de dados e a gravação do
+índice são feitos sob uma trava exclusiva (``fcntl.flock``), e o índice em
+disco é mesclado com as entradas novas antes de ser substituído.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+INDEX_FILE = 'index.json'
+DATA_FILE = 'objects.bin'
+LOCK_FILE = '.lock'
+
+class ObjectBank:
+    """
+    Arquivo de objetos extraídos, indexado por chave.
+
+    Cada entrada guarda a assinatura das fontes (``stamp``, por exemplo
+    mtime e tamanho dos arquivos) para detectar quando precisa ser refeita,
+    as mensagens de log da extração e os arrays ``uint8`` da máscara, do
+    fundo sem objeto e de cada objeto. Entradas refeitas são acrescentadas
+    ao final do arquivo; as antigas deixam de ser referenciadas.
+
+    Args:
+        path: Pasta do banco (criada se não existir)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._index_path = os.path.join(path, INDEX_FILE)
+        self._data_path = os.path.join(path, DATA_FILE)
+        self._lock_path = os.path.join(path, LOCK_FILE)
+        self.entries = self._read_index()
+        # Chaves acrescentadas por este processo desde o último save()
+        self._added = set()
+        self._data = None
+        self._data_size = None
+
+    def get(self, key, stamp):
+        """Devolve a entrada de ``key`` se ela existir e as fontes não mudaram."""
+        entry = self.entries.get(key)
+        if entry is None or entry['stamp'] != list(stamp):
+            return None
+        return entry
+
+    def load(self, key, mask=True):
+        """
+        Lê uma entrada como views do arquivo mapeado em memória.
+
+        Args:
+            mask: Devolve a máscara; as guardadas em PNG (``compact_mask``)
+                só são decodificadas quando pedidas
+
+        Returns:
+            Dict com ``messages``, ``shape`` (altura e largura da fonte),
+            ``mask``, ``fundo_sem_objeto`` e ``objects`` (lista de pares
+            imagem/máscara); os arrays são None se a fonte foi pulada na
+            extração.
+        """
+        entry = self.entries[key]
+        arrays = entry.get('arrays')
+        result = {'messages': entry['messages'], 'shape': None, 'mask': None, 'fundo_sem_objeto': None,
+                  'objects': None}
+        if arrays is None:
+            return result
+        if 'mask_png' in arrays:
+            result['shape'] = tuple(arrays['shape'])
+            if mask:
+                result['mask'] = cv2.imdecode(np.asarray(self._view(arrays['mask_png'])), cv2.IMREAD_GRAYSCALE)
+        else:
+            result['mask'] = self._view(arrays['mask'])
+            result['shape'] = result['mask'].shape[:2]
+        if arrays['fundo_sem_objeto'] is not None:
+            result['fundo_sem_objeto'] = self._view(arrays['fundo_sem_objeto'])
+        result['objects'] = [(self._view(img), self._view(mask)) for img, mask in arrays['objects']]
+        return result
+
+    def put(self, key, stamp, messages, mask=None, fundo_sem_objeto=None, objects=None, compact_mask=False):
+        """
+        Acrescenta (ou refaz) uma entrada. Sem arrays, registra a fonte como
+        pulada; sem ``fundo_sem_objeto``, o fundo é compartilhado e guardado
+        fora da entrada (quadros de vídeo usam o fundo do clipe). Com
+        ``compact_mask``, a máscara é guardada em PNG, que numa máscara de
+        poucos objetos ocupa uma fração do array.
+        """
+        entry = {'stamp': list(stamp), 'messages': list(messages)}
+        if mask is not None:
+            if compact_mask:
+                encoded = cv2.imencode('.png', mask)[1].ravel()
+            # Sob a trava, o fim do arquivo não muda entre o seek e a escrita
+            with self._locked(), open(self._data_path, 'ab') as f:
+                if compact_mask:
+                    arrays = {'mask_png': self._append(f, encoded), 'shape': list(mask.shape[:2])}
+                else:
+                    arrays = {'mask': self._append(f, mask)}
+                arrays['fundo_sem_objeto'] = None if fundo_sem_objeto is None else self._append(f, fundo_sem_objeto)
+                arrays['objects'] = [[self._append(f, img), self._append(f, obj_mask)] for img, obj_mask in objects]
+                entry['arrays'] = arrays
+        self.entries[key] = entry
+        self._added.add(key)
+
+    def save(self):
+        """
+        Grava o índice de forma atômica, mesclado com o índice em disco: as
+        entradas gravadas por outras execuções desde a abertura são mantidas.
+        """
+        with self._locked():
+            entries = self._read_index()
+            entries.update((key, self.entries[key]) for key in self._added)
+            tmp_path = f'{self._index_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': entries}, f)
+            os.replace(tmp_path, self._index_path)
+        self.entries = entries
+        self._added.clear()
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, encoding='utf-8') as f:
+                return json.load(f)['entries']
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    @contextmanager
+    def _locked(self):
+        """Trava exclusiva do banco entre processos (sem efeito onde não há fcntl)."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _append(self, f, array):
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        offset = f.seek(0, os.SEEK_END)
+        f.write(array.tobytes())
+        return [offset, list(array.shape)]
+
+    def _view(self, spec):
+        offset, shape = spec
+        size = os.path.getsize(self._data_path)
+        if self._data is None or self._data_size != size:
+            self._data = np.memmap(self._data_path, dtype=np.uint8, mode='r')
+            self._data_size = size
+        count = int(np.prod(shape))
+        return self._data[offset:offset + count].reshape(shape)
@@ -1,10 +1,15 @@
 import cv2
 
-def rotate_image_and_mask(image, mask, angle):
-    """Rotaciona a imagem e a máscara mantendo o mesmo tamanho."""
+def rotate_image_and_mask(image, mask, angle, out=None):
+    """Rotaciona a imagem e a máscara mantendo o mesmo tamanho.
+
+    Se ``out`` for um par (imagem, máscara) de arrays já alocados com o mesmo
+    formato das entradas, o resultado é escrito neles sem nova alocação.
+    """
     (h, w) = image.shape[:2]
     center = (w // 2, h // 2)
     M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    rotated_img = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0))
-    rotated_mask = cv2.warpAffine(mask, M, (w, h), flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    out_img, out_mask = out if out is not None else (None, None)
+    rotated_img = cv2.warpAffine(image, M, (w, h), dst=out_img, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0))
+    rotated_mask = cv2.warpAffine(mask, M, (w, h), dst=out_mask, flags=cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
     return rotated_img, rotated_mask
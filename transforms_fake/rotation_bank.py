@@ -0,0 +1,89 @@
+"""
+Banco de rotações pré-calculadas para os objetos extraídos.
+
+O mesmo objeto é rotacionado centenas de vezes ao gerar as variações de um
+fundo. Com o banco, o ângulo sorteado é arredondado para uma resolução fixa
+(por exemplo, a cada 1° ou 5°) e cada rotação é calculada uma única vez; as
+seguintes viram uma consulta ao cache.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from .rotate_image_and_mask import rotate_image_and_mask
+
+class RotationBank:
+    """
+    Cache LRU de pares (imagem, máscara) rotacionados, com limite de memória.
+
+    Cada objeto tem ``360 / step`` ângulos possíveis, preenchidos sob demanda
+    (ou todos de uma vez com ``precompute``). Quando o total de bytes passa de
+    ``max_bytes``, os objetos usados há mais tempo são descartados inteiros.
+
+    Args:
+        step: Resolução angular em graus
+        max_bytes: Memória máxima ocupada pelas rotações em cache
+    """
+
+    def __init__(self, step=1.0, max_bytes=256 * 1024 * 1024):
+        if step <= 0 or 360 % step:
+            raise ValueError(f'step deve dividir 360 graus, recebido {step}')
+        self.step = step
+        self.max_bytes = max_bytes
+        self.num_angles = int(round(360 / step))
+        self.nbytes = 0
+        self._objects = OrderedDict()
+
+    def quantize(self, angle):
+        """Arredonda ``angle`` para o ângulo mais próximo do banco, em [-180, 180)."""
+        index = int(round((angle + 180) / self.step)) % self.num_angles
+        return -180 + index * self.step
+
+    def rotate(self, key, image, mask, angle, out=None):
+        """
+        Devolve a rotação de ``image``/``mask`` pelo ângulo do banco mais
+        próximo de ``angle``, calculando-a apenas na primeira vez.
+
+        ``key`` identifica o objeto; os arrays devolvidos são compartilhados
+        pelo cache e não devem ser modificados (use ``out`` para obter cópias).
+        """
+        entries = self._entries(key)
+        index = int(round((angle + 180) / self.step)) % self.num_angles
+        entry = entries[index]
+        if entry is None:
+            entry = rotate_image_and_mask(image, mask, -180 + index * self.step)
+            entries[index] = entry
+            self.nbytes += entry[0].nbytes + entry[1].nbytes
+            self._evict()
+            if self.nbytes > self.max_bytes:
+                # Só o objeto atual já passa do limite: não guarda esta rotação
+                entries[index] = None
+                self.nbytes -= entry[0].nbytes + entry[1].nbytes
+        if out is not None:
+            np.copyto(out[0], entry[0])
+            np.copyto(out[1], entry[1])
+            return out
+        return entry
+
+    def precompute(self, key, image, mask):
+        """Calcula todas as rotações de um objeto de uma vez."""
+        for index in range(self.num_angles):
+            self.rotate(key, image, mask, -180 + index * self.step)
+
+    def clear(self):
+        self._objects.clear()
+        self.nbytes = 0
+
+    def _entries(self, key):
+        entries = self._objects.get(key)
+        if entries is None:
+            entries = [None] * self.num_angles
+            self._objects[key] = entries
+        self._objects.move_to_end(key)
+        return entries
+
+    def _evict(self):
+        # Nunca descarta o objeto em uso (o último da fila)
+        while self.nbytes > self.max_bytes and len(self._objects) > 1:
+            _, entries = self._objects.popitem(last=False)
+            self.nbytes -= sum(e[0].nbytes + e[1].nbytes for e in entries if e is not None)
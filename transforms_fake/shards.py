@@ -0,0 +1,199 @@
+"""
+Saída em shards tar no formato do WebDataset.
+
+Gravar dois arquivos pequenos por amostra em pastas planas sobrecarrega os
+metadados do sistema de arquivos a partir de centenas de milhares de
+amostras. Aqui as amostras são agrupadas em arquivos ``shard-NNNNNN.tar`` de
+tamanho fixo, com os membros de cada amostra em sequência
+(``{chave}.png``, ``{chave}.mask.png``, ``{chave}.json``), que podem ser lidos
+sequencialmente pelo WebDataset ou por ``tarfile``. Um ``index.json`` indica
+em que shard, e em que posição, está cada membro.
+
+Leitores sequenciais veem todos os membros de todos os tars, então uma
+amostra regravada numa retomada não pode continuar no shard antigo: ao fechar,
+os shards com amostras substituídas são reescritos só com as amostras
+vigentes e os arquivos são renumerados em sequência.
+"""
+import io
+import json
+import os
+import re
+import tarfile
+
+INDEX_FILE = 'index.json'
+SHARD_PATTERN = re.compile(r'shard-\d{6}\.tar')
+
+def key_stem(name):
+    """
+    Nome seguro para uma chave de amostra. Leitores do WebDataset separam a
+    chave da extensão no primeiro ponto, então os pontos do nome da fonte são
+    codificados (``cam.v0`` vira ``cam%2Ev0``; ``%`` vira ``%25``, para que
+    nomes diferentes nunca gerem a mesma chave).
+    """
+    return name.replace('%', '%25').replace('.', '%2E')
+
+def sample_key(member_name):
+    """Chave da amostra de um membro: o nome até o primeiro ponto (as chaves não têm pontos)."""
+    return member_name.split('.', 1)[0]
+
+class ShardWriter:
+    """
+    Grava amostras em shards tar de ``samples_per_shard`` amostras.
+
+    As amostras chegam em grupos de membros ``(nome, bytes)``; os membros de
+    uma mesma chave são gravados juntos. O índice é regravado (de forma
+    atômica) sempre que um shard é fechado, então só referencia shards
+    completos.
+
+    Args:
+        path: Pasta dos shards (criada se não existir)
+        samples_per_shard: Número de amostras por shard
+        append: Continua um índice existente, criando shards novos depois dos
+            já gravados; amostras regravadas passam a apontar para o shard
+            novo e saem do antigo em ``close()``. Sem ``append``, shards de
+            execuções anteriores são apagados
+    """
+
+    def __init__(self, path, samples_per_shard=1000, append=False):
+        if samples_per_shard < 1:
+            raise ValueError('samples_per_shard deve ser positivo')
+        self.path = path
+        self.samples_per_shard = samples_per_shard
+        os.makedirs(path, exist_ok=True)
+        self._index_path = os.path.join(path, INDEX_FILE)
+        self.shards = []
+        self.samples = {}
+        if append:
+            try:
+                with open(self._index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+                self.shards = index['shards']
+                self.samples = index['samples']
+            except (OSError, ValueError, KeyError):
+                pass
+        # Shards fora do índice: de uma execução anterior ou interrompidos no meio
+        listed = {shard['file'] for shard in self.shards}
+        for name in os.listdir(path):
+            if SHARD_PATTERN.fullmatch(name) and name not in listed:
+                os.remove(os.path.join(path, name))
+        if not append:
+            self._save_index()
+        self._tar = None
+        self._shard_samples = {}
+        self._count = 0
+        # Shards com amostras regravadas em shards mais novos
+        self._stale = set()
+
+    def add(self, members):
+        """
+        Grava os membros ``(nome, bytes)`` recebidos, agrupados por amostra,
+        com as amostras na ordem em que aparecem em ``members``.
+        """
+        groups = {}
+        for name, data in members:
+            groups.setdefault(sample_key(name), []).append((name, data))
+        for key in groups:
+            if self._tar is None:
+                self._open()
+            entry = {}
+            for name, data in sorted(groups[key]):
+                entry[name[len(key) + 1:]] = self._add_member(name, data)
+            self._shard_samples[key] = entry
+            self._count += 1
+            if self._count >= self.samples_per_shard:
+                self._close_shard()
+
+    def close(self):
+        """Fecha o shard atual, compacta os shards com amostras substituídas e grava o índice."""
+        if self._tar is not None:
+            self._close_shard()
+        if self._stale:
+            self._compact()
+
+    def keys(self):
+        """Chaves das amostras já presentes em shards completos."""
+        return set(self.samples)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open(self):
+        name = f'shard-{len(self.shards):06d}.tar'
+        self._tar = tarfile.open(os.path.join(self.path, name), 'w', format=tarfile.USTAR_FORMAT)
+        self._tar_name = name
+        self._shard_samples = {}
+        self._count = 0
+
+    def _add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        # mtime fixo: a mesma geração produz shards idênticos byte a byte
+        info.mtime = 0
+        self._tar.addfile(info, io.BytesIO(data))
+        padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return [self._tar.offset - padded, len(data)]
+
+    def _close_shard(self):
+        self._tar.close()
+        size = os.path.getsize(os.path.join(self.path, self._tar_name))
+        shard_index = len(self.shards)
+        self.shards.append({'file': self._tar_name, 'samples': self._count, 'bytes': size})
+        for key, entry in self._shard_samples.items():
+            previous = self.samples.get(key)
+            if previous is not None and previous['shard'] != shard_index:
+                self._stale.add(previous['shard'])
+            self.samples[key] = {'shard': shard_index, 'members': entry}
+        self._tar = None
+        self._save_index()
+
+    def _compact(self):
+        """
+        Reescreve os shards com amostras substituídas só com as vigentes (na
+        ordem original), apaga os que ficaram vazios e renumera os arquivos
+        em sequência.
+        """
+        live = {}
+        for key, sample in self.samples.items():
+            live.setdefault(sample['shard'], []).append(key)
+        shards = []
+        for i, shard in enumerate(self.shards):
+            path = os.path.join(self.path, shard['file'])
+            keys = live.get(i, [])
+            if i in self._stale:
+                if not keys:
+                    os.remove(path)
+                    continue
+                self._rewrite(path, sorted(keys, key=lambda k: min(m[0] for m in self.samples[k]['members'].values())))
+            name = f'shard-{len(shards):06d}.tar'
+            if name != shard['file']:
+                # Os anteriores já foram movidos ou apagados, então o nome está livre
+                os.replace(path, os.path.join(self.path, name))
+            for key in keys:
+                self.samples[key]['shard'] = len(shards)
+            shards.append({'file': name, 'samples': len(keys),
+                           'bytes': os.path.getsize(os.path.join(self.path, name))})
+        self.shards = shards
+        self._stale.clear()
+        self._save_index()
+
+    def _rewrite(self, path, keys):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(path, 'rb') as src:
+            self._tar = tarfile.open(tmp_path, 'w', format=tarfile.USTAR_FORMAT)
+            for key in keys:
+                members = self.samples[key]['members']
+                for ext, (offset, size) in sorted(members.items(), key=lambda item: item[1][0]):
+                    src.seek(offset)
+                    members[ext] = self._add_member(f'{key}.{ext}', src.read(size))
+            self._tar.close()
+            self._tar = None
+        os.replace(tmp_path, path)
+
+    def _save_index(self):
+        tmp_path = f'{self._index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'shards': self.shards, 'samples': self.samples}, f)
+        os.replace(tmp_path, self._index_path)
@@ -0,0 +1,170 @@
+"""
+Transformações aplicadas a cada objeto antes da colagem.
+
+Um ``ObjectTransform`` descreve, de forma declarativa, os intervalos de
+rotação e escala, a probabilidade de espelhamento, a variação de brilho e
+contraste e o modo de mesclagem com o fundo. As operações geométricas são
+combinadas numa única matriz afim, então cada amostra continua custando um
+``warpAffine`` para a imagem e um para a máscara, qualquer que seja o número
+de transformações ativas.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Modos de mesclagem: colagem direta, borda suavizada ou clonagem de Poisson
+BLEND_MODES = ('paste', 'feather', 'poisson')
+
+# Parâmetros sorteados para uma amostra. ``alpha`` e ``beta`` são o ganho de
+# contraste e o deslocamento de brilho aplicados aos pixels do objeto.
+TransformParams = namedtuple('TransformParams', ['angle', 'scale', 'hflip', 'vflip', 'alpha', 'beta'])
+
+class ObjectTransform:
+    """
+    Pipeline de transformações de um objeto.
+
+    Só os parâmetros com variação consomem o gerador aleatório, então o
+    pipeline padrão (apenas rotação) sorteia exatamente o mesmo que as
+    versões anteriores e gera as mesmas amostras para a mesma semente.
+
+    Args:
+        rotation: Intervalo ``(min, max)`` do ângulo em graus
+        scale: Intervalo ``(min, max)`` do fator de escala
+        hflip: Probabilidade de espelhar o objeto horizontalmente
+        vflip: Probabilidade de espelhar o objeto verticalmente
+        brightness: Deslocamento máximo de brilho, em níveis (±)
+        contrast: Variação máxima do ganho de contraste (1 ± contrast)
+        blend: 'paste', 'feather' ou 'poisson' (``cv2.seamlessClone``)
+        feather: Largura em pixels da borda suavizada no modo 'feather'
+    """
+
+    def __init__(self, rotation=(-180, 180), scale=(1.0, 1.0), hflip=0.0, vflip=0.0,
+                 brightness=0.0, contrast=0.0, blend='paste', feather=5):
+        self.rotation = tuple(float(v) for v in rotation)
+        self.scale = tuple(float(v) for v in scale)
+        self.hflip = float(hflip)
+        self.vflip = float(vflip)
+        self.brightness = float(brightness)
+        self.contrast = float(contrast)
+        self.blend = blend
+        self.feather = int(feather)
+        if len(self.rotation) != 2 or self.rotation[0] > self.rotation[1]:
+            raise ValueError(f'rotation deve ser um intervalo (min, max), recebido {rotation}')
+        if len(self.scale) != 2 or not 0 < self.scale[0] <= self.scale[1]:
+            raise ValueError(f'scale deve ser um intervalo (min, max) positivo, recebido {scale}')
+        if not (0 <= self.hflip <= 1 and 0 <= self.vflip <= 1):
+            raise ValueError('hflip e vflip são probabilidades entre 0 e 1')
+        if self.brightness < 0 or not 0 <= self.contrast < 1:
+            raise ValueError('brightness deve ser >= 0 e contrast deve estar em [0, 1)')
+        if blend not in BLEND_MODES:
+            raise ValueError(f'Modo de mesclagem não suportado: {blend}')
+        if self.feather < 1:
+            raise ValueError('feather deve ser pelo menos 1 pixel')
+
+    @classmethod
+    def from_dict(cls, config):
+        """Cria o pipeline a partir de um dict (por exemplo, lido de YAML ou JSON)."""
+        return cls(**config)
+
+    def to_dict(self):
+        """Configuração como dict serializável em JSON."""
+        return {
+            'rotation': list(self.rotation), 'scale': list(self.scale), 'hflip': self.hflip,
+            'vflip': self.vflip, 'brightness': self.brightness, 'contrast': self.contrast,
+            'blend': self.blend, 'feather': self.feather,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, ObjectTransform) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        args = ', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())
+        return f'ObjectTransform({args})'
+
+    def sample(self, rng):
+        """Sorteia os parâmetros de uma amostra com o gerador ``rng``."""
+        angle = rng.uniform(*self.rotation)
+        scale = rng.uniform(*self.scale) if self.scale[0] != self.scale[1] else self.scale[0]
+        hflip = self.hflip > 0 and rng.random() < self.hflip
+        vflip = self.vflip > 0 and rng.random() < self.vflip
+        alpha = rng.uniform(1 - self.contrast, 1 + self.contrast) if self.contrast else 1.0
+        beta = rng.uniform(-self.brightness, self.brightness) if self.brightness else 0.0
+        return TransformParams(angle, scale, hflip, vflip, alpha, beta)
+
+DEFAULT_TRANSFORM = ObjectTransform()
+
+def warped_size(w, h, scale):
+    """Tamanho ``(w, h)`` do objeto transformado: o recorte escalado."""
+    if scale == 1.0:
+        return w, h
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+def affine_matrix(w, h, params):
+    """
+    Matriz afim 2×3 que espelha, rotaciona e escala um recorte ``w × h`` em
+    torno do centro, centralizando o resultado em ``warped_size``.
+
+    Sem escala nem espelhamento, é a mesma matriz de ``rotate_image_and_mask``.
+    """
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, params.angle, params.scale)
+    if params.hflip or params.vflip:
+        flip = np.array([[-1.0 if params.hflip else 1.0, 0.0, w - 1 if params.hflip else 0.0],
+                         [0.0, -1.0 if params.vflip else 1.0, h - 1 if params.vflip else 0.0],
+                         [0.0, 0.0, 1.0]])
+        M = M @ flip
+    out_w, out_h = warped_size(w, h, params.scale)
+    M[0, 2] += out_w // 2 - center[0]
+    M[1, 2] += out_h // 2 - center[1]
+    return M
+
+def warp_object(image, mask, params, out=None):
+    """
+    Aplica a parte geométrica de ``params`` com um único ``warpAffine`` para
+    a imagem e um para a máscara (vizinho mais próximo, preservando as classes).
+
+    Args:
+        out: Par (imagem, máscara) de arrays já alocados com ``warped_size``
+    """
+    h, w = image.shape[:2]
+    M = affine_matrix(w, h, params)
+    size = warped_size(w, h, params.scale)
+    out_img, out_mask = out if out is not None else (None, None)
+    warped_img = cv2.warpAffine(image, M, size, dst=out_img, flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+    warped_mask = cv2.warpAffine(mask, M, size, dst=out_mask, flags=cv2.INTER_NEAREST,
+                                 borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    return warped_img, warped_mask
+
+def adjust_colors(image, params, out=None):
+    """Aplica contraste e brilho (``alpha * pixel + beta``, saturado em uint8)."""
+    if params.alpha == 1.0 and params.beta == 0.0:
+        if out is not None and out is not image:
+            out[...] = image
+            return out
+        return image
+    return cv2.addWeighted(image, params.alpha, image, 0, params.beta, dst=out)
+
+def feather_blend(roi, obj, obj_mask, radius):
+    """Mescla ``obj`` em ``roi`` (in-place) com a borda suavizada para dentro do objeto."""
+    inside = (obj_mask > 0).astype(np.float32)
+    k = 2 * radius + 1
+    alpha = (cv2.GaussianBlur(inside, (k, k), 0) * inside)[..., None]
+    roi[...] = (obj * alpha + roi * (1 - alpha) + 0.5).astype(np.uint8)
+
+def poisson_blend(roi, obj, obj_mask):
+    """
+    Mescla ``obj`` em ``roi`` (in-place) com ``cv2.seamlessClone``. A
+    clonagem é feita só na região do objeto, sem copiar o quadro inteiro.
+    """
+    mask = (obj_mask > 0).astype(np.uint8) * 255
+    # seamlessClone precisa de uma borda livre em volta da máscara
+    mask[0, :] = mask[-1, :] = 0
+    mask[:, 0] = mask[:, -1] = 0
+    if not mask.any():
+        return False
+    x, y, w, h = cv2.boundingRect(mask)
+    center = (x + w // 2, y + h // 2)
+    roi[...] = cv2.seamlessClone(obj, np.ascontiguousarray(roi), mask, center, cv2.NORMAL_CLONE)
+    return True
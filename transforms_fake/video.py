@@ -0,0 +1,159 @@
+"""
+Leitura de vídeos e modelo temporal de fundo.
+
+Extrair os quadros de uma gravação longa para JPEGs e depois decodificá-los
+de novo custa mais que a própria geração. ``VideoFrames`` lê o vídeo
+diretamente com ``cv2.VideoCapture`` numa thread de decodificação, que
+trabalha em paralelo com o consumo dos quadros; os quadros pulados pelo passo
+(``stride``) são só avançados com ``grab()``, sem decodificar a imagem.
+
+Com a câmera fixa, o fundo é o mesmo em todos os quadros de um clipe.
+``RunningMedian`` estima esse fundo limpo (clean plate) uma única vez,
+atualizando uma mediana aproximada apenas nos pixels sem objeto de cada
+quadro, em vez de reconstruir o fundo quadro a quadro.
+"""
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v', '.mpg', '.mpeg')
+
+def is_video(path):
+    """Indica se ``path`` é um arquivo de vídeo (pela extensão)."""
+    return os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+
+def frame_name(index):
+    """Nome de um quadro, numerado a partir de 1 como no ``ffmpeg`` (``frame_00001.png``)."""
+    return f'frame_{index + 1:05d}.png'
+
+class VideoFrames:
+    """
+    Quadros de um vídeo, decodificados numa thread em segundo plano.
+
+    Iterar devolve pares ``(índice, quadro)`` com o índice do quadro no
+    vídeo (a partir de 0). No máximo ``queue_size`` quadros decodificados
+    ficam na fila, então a memória usada não depende do tamanho do vídeo.
+
+    Args:
+        path: Arquivo de vídeo
+        stride: Usa um quadro a cada ``stride``
+        max_frames: Número máximo de quadros. Se o vídeo informa quantos
+            quadros tem, o passo é aumentado para espalhá-los pelo clipe
+            inteiro, em vez de usar só o começo
+        grayscale: Converte os quadros para tons de cinza (vídeos de máscaras)
+        queue_size: Quadros decodificados à frente do consumidor
+    """
+
+    def __init__(self, path, stride=1, max_frames=None, grayscale=False, queue_size=8):
+        if stride < 1:
+            raise ValueError('stride deve ser positivo')
+        self.path = path
+        self.grayscale = grayscale
+        self.queue_size = queue_size
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError(f'Não foi possível abrir o vídeo: {path}')
+        self.frame_count = max(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        self.width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        capture.release()
+        if max_frames is not None and self.frame_count:
+            stride = max(stride, self.frame_count // max(max_frames, 1))
+        self.stride = stride
+        self.max_frames = max_frames
+
+    def __len__(self):
+        """Número estimado de quadros devolvidos (0 se o vídeo não informa)."""
+        count = -(-self.frame_count // self.stride)
+        return count if self.max_frames is None else min(count, self.max_frames)
+
+    def __iter__(self):
+        frames = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._decode, args=(frames, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Consumidor interrompido: libera a thread, que pode estar bloqueada na fila cheia
+            stop.set()
+            while thread.is_alive():
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    thread.join(0.05)
+
+    def _decode(self, frames, stop):
+        capture = cv2.VideoCapture(self.path)
+        try:
+            index = 0
+            count = 0
+            while not stop.is_set() and (self.max_frames is None or count < self.max_frames):
+                if not capture.grab():
+                    break
+                if index % self.stride == 0:
+                    ok, frame = capture.retrieve()
+                    if not ok:
+                        break
+                    if self.grayscale and frame.ndim == 3:
+                        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    frames.put((index, frame))
+                    count += 1
+                index += 1
+        except Exception as e:
+            frames.put(e)
+        finally:
+            capture.release()
+            frames.put(None)
+
+class RunningMedian:
+    """
+    Mediana temporal aproximada de cada pixel, atualizada quadro a quadro.
+
+    A cada quadro, a estimativa de cada pixel visto como fundo anda um nível
+    em direção ao valor observado; com quadros suficientes ela converge para
+    a mediana, com custo constante por quadro e sem guardar o histórico.
+
+    Args:
+        shape: Formato ``(H, W, 3)`` dos quadros
+    """
+
+    def __init__(self, shape):
+        self.estimate = np.zeros(shape, dtype=np.uint8)
+        self.seen = np.zeros(shape[:2], dtype=bool)
+        self.frames = 0
+
+    def update(self, frame, background=None):
+        """
+        Incorpora um quadro.
+
+        Args:
+            frame: Quadro ``(H, W, 3)`` uint8
+            background: Máscara ``(H, W)`` bool dos pixels de fundo (None
+                considera o quadro inteiro)
+        """
+        if background is None:
+            background = np.ones(frame.shape[:2], dtype=bool)
+        first = background & ~self.seen
+        np.copyto(self.estimate, frame, where=first[..., None])
+        update = (background & self.seen)[..., None]
+        self.estimate += ((frame > self.estimate) & update).astype(np.uint8)
+        self.estimate -= ((frame < self.estimate) & update).astype(np.uint8)
+        self.seen |= background
+        self.frames += 1
+
+    def plate(self):
+        """
+        Fundo estimado no formato de ``background_fill.masked_median``: BGR e,
+        no quarto canal, 255 onde o pixel já foi visto como fundo.
+        """
+        return np.dstack([self.estimate, self.seen.astype(np.uint8) * 255])
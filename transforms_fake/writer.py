@@ -0,0 +1,132 @@
+"""
+Gravação assíncrona das imagens geradas.
+
+A compressão PNG ocupa a maior parte do tempo de geração. Como o OpenCV
+libera o GIL durante a codificação, um pool de threads consegue codificar e
+gravar enquanto a próxima variação é composta. Uma fila limitada garante que
+a memória não cresça se a composição for mais rápida que o disco.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import cv2
+
+from .instrumentation import NULL_TRACER
+
+# Extensão usada para cada formato de imagem aceito
+IMAGE_FORMATS = {'png': '.png', 'jpg': '.jpg', 'jpeg': '.jpg', 'webp': '.webp'}
+
+def encode_params(image_format, quality=None):
+    """
+    Monta os parâmetros de ``cv2.imwrite`` para um formato.
+
+    Args:
+        image_format: 'png', 'jpg'/'jpeg' ou 'webp'
+        quality: Nível de compressão PNG (0-9), qualidade JPEG (0-100) ou
+            qualidade WebP (1-100; acima de 100 é sem perdas). None usa o
+            padrão do OpenCV.
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Formato de imagem não suportado: {image_format}')
+    if quality is None:
+        return []
+    if image_format == 'png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(quality)]
+    if image_format == 'webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+
+def _imwrite(path, array, params, tracer=NULL_TRACER, sink=None):
+    # Codifica e grava em passos separados para medir cada um
+    with tracer.stage('encode'):
+        ok, encoded = cv2.imencode(os.path.splitext(path)[1], array, params)
+    if not ok:
+        raise OSError(f'Falha ao codificar {path}')
+    if sink is not None:
+        sink(path, encoded.tobytes())
+        tracer.count('bytes_encoded', encoded.nbytes)
+        return
+    with tracer.stage('write'):
+        with open(path, 'wb') as f:
+            f.write(encoded)
+    tracer.count('files_written')
+    tracer.count('bytes_written', encoded.nbytes)
+
+class AsyncImageWriter:
+    """
+    Grava imagens em segundo plano com um pool de threads e fila limitada.
+
+    ``write`` bloqueia quando já há ``max_pending`` gravações pendentes, o
+    que limita a memória ocupada pelas imagens à espera de codificação. Com
+    ``threads=0`` as gravações são síncronas. Erros de gravação são
+    relançados por ``write`` ou ``close``.
+
+    Args:
+        threads: Número de threads de codificação/gravação
+        max_pending: Máximo de imagens na fila antes de bloquear
+        tracer: ``Tracer`` que recebe os tempos de codificação e gravação
+        sink: Função ``sink(nome, bytes)`` que recebe as imagens codificadas
+            em vez de gravá-las em disco (usada pela saída em shards); o
+            ``path`` de ``write`` passa a ser só o nome entregue a ela
+    """
+
+    def __init__(self, threads=2, max_pending=16, tracer=NULL_TRACER, sink=None):
+        self._tracer = tracer
+        self._sink = sink
+        self._pool = ThreadPoolExecutor(max_workers=threads) if threads > 0 else None
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._error = None
+
+    def write(self, path, array, params=()):
+        """
+        Agenda a gravação de ``array`` em ``path``.
+
+        O array não deve ser modificado até a gravação terminar; o future
+        devolvido permite esperar por ela (None no modo síncrono).
+        """
+        self._raise_error()
+        if self._pool is None:
+            _imwrite(path, array, list(params), self._tracer, self._sink)
+            return None
+        self._slots.acquire()
+        future = self._pool.submit(_imwrite, path, array, list(params), self._tracer, self._sink)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def flush(self):
+        """Espera todas as gravações pendentes."""
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+        self._raise_error()
+
+    def close(self):
+        """Espera as gravações pendentes e encerra as threads."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if self._error is None and future.exception() is not None:
+                self._error = future.exception()
+        self._slots.release()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error